@@ -1,36 +1,101 @@
+from datetime import date
+
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import requests
+from countries import ISO3_COLUMN, KEY_COLUMN, country_dimension
+from geometry import load_countries_geojson
+from ingest import load_source
 
 
 class AllianceMap:
-    def __init__(self, dataset_path=None, bases_path=None):
+    # Optional columns bounding the years a relationship was in force; a missing bound leaves it open on that side, and
+    # a table without the columns is treated as always active
+    start_column = 'start_year'
+    end_column = 'end_year'
+
+    def __init__(self, dataset_path=None, bases_path=None, simplify_tolerance=None):
         if dataset_path is None:
             dataset_path = '/final/dashboard/data/US_China_Alliances_Partnerships.csv'
-        self.df_alliances = pd.read_csv(dataset_path)
+        relations = load_source(dataset_path)
+        # From here on partner countries are identified by their ISO3 code, which is also the geometry's feature id
+        relations = relations[relations[KEY_COLUMN] >= 0].reset_index(drop=True)
+        relations['country2'] = relations[ISO3_COLUMN]
         # Determine overlaps
-        self.df_alliances = self.df_alliances.groupby('country2').apply(self.aggregate_relations).reset_index()
+        self.df_alliances = self.aggregate_relations(relations).reset_index()
+        dimension = country_dimension()
+        self.df_alliances['name'] = dimension.names[dimension.keys(self.df_alliances['country2'])]
+        # Color value of every country for every year, so showing another year is a row lookup
+        self.years, self.status = self.yearly_status(relations, self.df_alliances['country2'])
+
+        self.geojson = load_countries_geojson(simplify_tolerance)
+
+    @staticmethod
+    def aggregate_relations(df):
+        # One row per partner country: 'US', 'China' or 'Both' from per-country flags, and each descriptive column
+        # as its distinct values joined in order of first appearance
+        by_country = df['country2']
+        has_us = df['country1'].eq('US').groupby(by_country).any()
+        has_china = df['country1'].eq('China').groupby(by_country).any()
+        relations = pd.DataFrame({
+            column: AllianceMap.join_unique(df, column) for column in ['country1', 'type', 'goal', 'organization']
+        }, index=has_us.index).fillna('')
+        relations.loc[has_us & has_china, 'country1'] = 'Both'
+        relations.index.name = 'country2'
+        return relations
 
-        self.geojson = self.fetch_geojson()
-        self.change_json_id_to_name()
+    @staticmethod
+    def join_unique(df, column):
+        pairs = df[['country2', column]].dropna().drop_duplicates()
+        return pairs.groupby('country2')[column].agg(' / '.join)
+
+    def yearly_status(self, relations, countries):
+        # (year, country) matrix of colorscale positions: 0 for US, 0.5 for both, 1 for China, NaN when neither
+        starts = self.year_bounds(relations, self.start_column)
+        ends = self.year_bounds(relations, self.end_column)
+        bounds = np.concatenate([starts[np.isfinite(starts)], ends[np.isfinite(ends)]])
+        current_year = date.today().year
+        first_year = int(bounds.min()) if bounds.size else current_year
+        last_year = max(int(bounds.max()) if bounds.size else current_year, current_year)
+        years = np.arange(first_year, last_year + 1)
+
+        codes = pd.Index(countries).get_indexer(relations['country2'])
+        return years, self.alignment(relations, codes, len(countries), years).T
+
+    @classmethod
+    def alignment(cls, relations, codes, n_countries, years):
+        # (country, year) matrix of colorscale positions: 0 for US, 0.5 for both, 1 for China, NaN when neither.
+        # codes gives each relation's row in the matrix; the map and the country-year panel both code alignment here
+        active = cls.active_years(relations, years)
+
+        def partnered(country1):
+            rows = relations['country1'].eq(country1).to_numpy(dtype=bool, na_value=False)
+            counts = np.zeros((n_countries, len(years)))
+            np.add.at(counts, codes[rows], active[rows])
+            return counts > 0
+
+        has_us, has_china = partnered('US'), partnered('China')
+        return np.select([has_us & has_china, has_us, has_china], [0.5, 0, 1], default=np.nan)
+
+    @classmethod
+    def active_years(cls, relations, years):
+        # (relation, year) mask of the years each relationship was in force
+        starts = cls.year_bounds(relations, cls.start_column)
+        ends = cls.year_bounds(relations, cls.end_column)
+        return (np.nan_to_num(starts, nan=-np.inf)[:, None] <= years) & \
+               (years <= np.nan_to_num(ends, nan=np.inf)[:, None])
 
     @staticmethod
-    def aggregate_relations(group):
-        if 'US' in group['country1'].values and 'China' in group['country1'].values:
-            country1 = 'Both'
-        else:
-            country1 = ' / '.join(set(group['country1']))
-
-        type_combined = ' / '.join(set(group['type']))  # Combine unique types
-        goal_combined = ' / '.join(set(group['goal']))  # Combine unique goals
-        organization_combined = ' / '.join(set(group['organization']))  # Combine unique organizations
-
-        return pd.Series({
-            'country1': country1,
-            'type': type_combined,
-            'goal': goal_combined,
-            'organization': organization_combined
-        })
+    def year_bounds(relations, column):
+        if column not in relations:
+            return np.full(len(relations), np.nan)
+        return pd.to_numeric(relations[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+    def status_for(self, year=None):
+        # Colorscale positions for a year, clamped to the years covered; defaults to the current year
+        if year is None:
+            return self.status[-1]
+        return self.status[np.clip(np.searchsorted(self.years, year), 0, len(self.years) - 1)]
 
     @staticmethod
     def assign_color(country1):
@@ -41,16 +106,9 @@ class AllianceMap:
         elif country1 == 'China':
             return 1  # Red for China
 
-    def create_map(self):
+    def create_map(self, year=None):
         fig = go.Figure()
 
-        # Map the categories to normalized positions on the colorscale
-        self.df_alliances['color_value'] = self.df_alliances['country1'].map({
-            'US': 0,  # Start of the scale
-            'Both': 0.5,  # Midpoint of the scale
-            'China': 1  # End of the scale
-        })
-
         # Define a colorscale that maps these normalized positions to specific colors
         custom_colorscale = [
             [0, 'blue'],  # Color for 'US'
@@ -61,9 +119,12 @@ class AllianceMap:
         alliance_trace = go.Choroplethmapbox(
             geojson=self.geojson,
             locations=self.df_alliances['country2'],
-            z=self.df_alliances['color_value'],  # Numeric values mapped to colors
+            z=self.status_for(year),  # Normalized positions on the colorscale
             colorscale=custom_colorscale,
-            text=self.df_alliances.apply(lambda x: f"{x['type']} / {x['goal']} / {x['organization']}", axis=1),
+            zmin=0,
+            zmax=1,
+            text=(self.df_alliances['name'] + '<br>' + self.df_alliances['type'] + ' / ' + self.df_alliances['goal'] +
+                  ' / ' + self.df_alliances['organization']),
             marker_line_color='black',
             marker_line_width=0.5,
             colorbar=dict(
@@ -85,14 +146,3 @@ class AllianceMap:
 
         return fig
 
-    @staticmethod
-    def fetch_geojson():
-        url = "https://raw.githubusercontent.com/johan/world.geo.json/master/countries.geo.json"
-        response = requests.get(url)
-        return response.json()
-
-    def change_json_id_to_name(self):
-        # Change the 'id' field to 'name' in the GeoJSON
-        for feature in self.geojson['features']:
-            feature['id'] = feature['properties']['name']
-
@@ -1,16 +1,21 @@
-import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from key.key import mapbox_access_token
+from cache import LRUCache, file_signature
+from ingest import load_source
+from spatial import WORLD, PointLayer
 
 
 class MilitaryBasesMap:
+    # Point arrays of the bases layer for each version of a bases file, shared by every map that draws it
+    _layers = LRUCache(max_size=4)
+
     def __init__(self, file_path=None):
         if file_path is None:
             file_path = 'data/Overseas Military Bases.xlsx'
         self.file_path = file_path
         self.mapbox_access_token = mapbox_access_token
-        self.df = pd.read_excel(file_path, sheet_name='Overseas military base')
+        self.df = load_source(file_path)
         self.color_codes = {
             "United States": '#0000FF',
             "China": "#FF0000",
@@ -31,35 +36,58 @@ class MilitaryBasesMap:
         self.default_color = "#FFFF00"
 
     def assign_colors(self):
-        self.df['Color'] = self.df['Operator'].apply(lambda x: self.color_codes.get(x, self.default_color))
+        self.df['Color'] = self.layer()['color']
 
-    def create_map(self, update_layout=True):
-        fig = make_subplots(rows=1, cols=1, specs=[[{'type': 'scattermapbox'}]])
+    def layer(self):
+        return self._layers.get_or_build(file_signature(self.file_path), self._build_layer)
 
-        for group, color in self.color_codes.items():
-            df_group = self.df[self.df['Operator'] == group]
-            if not df_group.empty:
-                fig.add_trace(go.Scattermapbox(
-                    lat=df_group['Y'],
-                    lon=df_group['X'],
-                    mode='markers',
-                    marker=go.scattermapbox.Marker(size=9, color=color),
-                    hoverinfo='text',
-                    hovertext=df_group['Name'] + ' - ' + df_group['Operator'],
-                    name=group
-                ))
+    def _build_layer(self):
+        operators = self.df['Operator']
+        known = operators.isin(self.color_codes.keys()).to_numpy(dtype=bool, na_value=False)
+        present = set(operators[known].astype(str))
+        legend = [(group, color) for group, color in self.color_codes.items() if group in present]
+        if not known.all():
+            legend.append(('Other', self.default_color))
+        colors = operators.astype(object).map(self.color_codes).fillna(self.default_color).to_numpy(dtype=object)
+        hovertext = (self.df['Name'] + ' - ' + operators).astype(object).to_numpy(dtype=object)
+        return {
+            'color': colors,
+            # Spatially indexed copy of the points, served to the map one viewport at a time
+            'points': PointLayer(self.df['X'], self.df['Y'], colors, hovertext, size=9, label='bases'),
+            'legend': legend
+        }
 
-        df_default = self.df[~self.df['Operator'].isin(self.color_codes.keys())]
-        if not df_default.empty:
-            fig.add_trace(go.Scattermapbox(
-                lat=df_default['Y'],
-                lon=df_default['X'],
+    def traces(self, bounds=WORLD, zoom=1):
+        # The bases in view are one point trace colored per point; the operator legend comes from empty proxy traces in
+        # the same legend group, so clicking any entry toggles the whole layer
+        layer = self.layer()
+        view = layer['points'].view(bounds, zoom)
+        traces = [go.Scattermapbox(
+            lat=view['lat'],
+            lon=view['lon'],
+            mode='markers',
+            marker=go.scattermapbox.Marker(size=view['size'], color=view['color']),
+            hoverinfo='text',
+            hovertext=view['hovertext'],
+            name='Military bases',
+            legendgroup='military-bases',
+            showlegend=False
+        )]
+        for group, color in layer['legend']:
+            traces.append(go.Scattermapbox(
+                lat=[None],
+                lon=[None],
                 mode='markers',
-                marker=go.scattermapbox.Marker(size=9, color=self.default_color),
-                hoverinfo='text',
-                hovertext=df_default['Name'] + ' - ' + df_default['Operator'],
-                name='Other'
+                marker=go.scattermapbox.Marker(size=9, color=color),
+                hoverinfo='skip',
+                name=group,
+                legendgroup='military-bases'
             ))
+        return traces
+
+    def create_map(self, update_layout=True):
+        fig = make_subplots(rows=1, cols=1, specs=[[{'type': 'scattermapbox'}]])
+        fig.add_traces(self.traces())
         if update_layout:
             fig.update_layout(
                 mapbox_style="light",
@@ -1,5 +1,6 @@
-import pandas as pd
 import plotly.graph_objects as go
+from countries import ISO3_COLUMN, country_totals
+from ingest import load_source
 
 
 class InvestmentChoroplethMap:
@@ -14,22 +15,22 @@ class InvestmentChoroplethMap:
             dataset2_path = 'data/Construction.csv'
         if combined_path is None:
             combined_path = 'data/Investments_and_construction.csv'
-        self.df_dataset1 = pd.read_csv(dataset1_path)
-        self.df_dataset2 = pd.read_csv(dataset2_path)
-        self.df_combined = pd.read_csv(combined_path)
+        self.df_dataset1 = load_source(dataset1_path)
+        self.df_dataset2 = load_source(dataset2_path)
+        self.df_combined = load_source(combined_path)
 
     def preprocess_data(self):
         # Preprocess each dataset to summarize investments by country
-        self.summary_dataset1 = self.df_dataset1.groupby('Country')['Quantity in Millions'].sum().reset_index()
-        self.summary_dataset2 = self.df_dataset2.groupby('Country')['Quantity in Millions'].sum().reset_index()
-        self.summary_combined = self.df_combined.groupby('Country')['Quantity in Millions'].sum().reset_index()
+        self.summary_dataset1 = country_totals(self.df_dataset1, 'Quantity in Millions')
+        self.summary_dataset2 = country_totals(self.df_dataset2, 'Quantity in Millions')
+        self.summary_combined = country_totals(self.df_combined, 'Quantity in Millions')
 
     @staticmethod
     def create_choropleth(df, title):
         # Helper function to create a choropleth map for a given dataset
         return go.Choropleth(
-            locations=df['Country'],
-            locationmode='country names',
+            locations=df[ISO3_COLUMN],
+            locationmode='ISO-3',
             z=df['Quantity in Millions'],
             text=df['Country'],
             colorscale='Reds',
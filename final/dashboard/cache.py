@@ -0,0 +1,114 @@
+import os
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def file_signature(*paths):
+    # Identify the on-disk version of one or more source files by mtime and size
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class LRUCache:
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, builder):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            # Build outside the lock so a slow build doesn't stall unrelated lookups
+            value = builder()
+            self.put(key, value)
+        return value
+
+    def items(self):
+        # Snapshot of the cached entries, least recently used first; doesn't affect their order
+        with self._lock:
+            return list(self._entries.items())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class FigureCache(LRUCache):
+    def __init__(self, max_size=16):
+        super().__init__(max_size)
+        self._current = {}
+        self._build_locks = {}
+
+    def _build_lock(self, route):
+        with self._lock:
+            return self._build_locks.setdefault(route, threading.Lock())
+
+    def latest(self, route):
+        # Most recently published figure for the route, whatever source version it was built from
+        with self._lock:
+            return self._entries.get(self._current.get(route))
+
+    def publish(self, route, key, figure):
+        # Swap the route over to the new figure in one step and drop the version it replaces
+        with self._lock:
+            self.put(key, figure)
+            stale_key = self._current.get(route)
+            if stale_key is not None and stale_key != key:
+                self._entries.pop(stale_key, None)
+            self._current[route] = key
+
+    def refresh(self, route, source_paths, builder, wait=True):
+        # Builds and publishes the figure for the current source files unless it is already published. Only one
+        # build per route runs at a time; with wait=False a build that is already running is left to finish alone
+        key = (route, file_signature(*source_paths))
+        build_lock = self._build_lock(route)
+        if not build_lock.acquire(blocking=wait):
+            return None
+        try:
+            figure = self.get(key, _MISSING)
+            if figure is _MISSING:
+                figure = builder()
+                self.publish(route, key, figure)
+            return figure
+        finally:
+            build_lock.release()
+
+    def get_figure(self, route, source_paths, builder):
+        # The key carries the source files' signature, so editing a dataset on disk yields a fresh build
+        key = (route, file_signature(*source_paths))
+        figure = self.get(key, _MISSING)
+        if figure is not _MISSING:
+            return figure
+        previous = self.latest(route)
+        if previous is None:
+            return self.refresh(route, source_paths, builder)
+        # An older version exists: serve it now and rebuild in the background rather than block the request
+        threading.Thread(target=self.refresh, args=(route, source_paths, builder, False), daemon=True).start()
+        return previous
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+METADATA_PATH = 'data/Metadata_Country_API_NY.GDP.MKTP.CD_DS2_en_csv_v2_240389.csv'
+
+# Economies the World Bank list leaves out
+EXTRA_COUNTRIES = {
+    'TWN': 'Taiwan',
+}
+
+# Other spellings of a country used across the datasets (AEI tracker, SIPRI, alliances, bases, World Bank data file,
+# GeoJSON), by ISO3 code. Names and codes from the World Bank metadata match without being listed here
+ALIASES = {
+    'ARE': ['UAE', 'United Arab Emirates'],
+    'BHS': ['Bahamas', 'The Bahamas'],
+    'BIH': ['Bosnia', 'Bosnia-Herzegovina'],
+    'BRN': ['Brunei'],
+    'CIV': ['Ivory Coast', "Cote d'Ivoire"],
+    'COD': ['Democratic Republic of the Congo', 'DR Congo', 'Congo, DR'],
+    'COG': ['Congo', 'Republic of the Congo', 'Congo, Republic'],
+    'CPV': ['Cape Verde'],
+    'CUW': ['Curacao'],
+    'CZE': ['Czech Republic', 'Czechia'],
+    'EGY': ['Egypt'],
+    'GBR': ['Britain', 'UK', 'United Kingdoms', 'Great Britain'],
+    'IRN': ['Iran'],
+    'KGZ': ['Kyrgyzstan'],
+    'KOR': ['South Korea', 'Korea, South', 'Republic of Korea'],
+    'LAO': ['Laos'],
+    'MKD': ['Macedonia', 'North Macedonia'],
+    'PRK': ['North Korea', 'Korea, North', 'DPRK'],
+    'QAT': ['Quatar'],
+    'RUS': ['Russia'],
+    'SOM': ['Republic of Somaliland', 'Somaliland'],
+    'SRB': ['Republic of Serbia'],
+    'SSD': ['S. Sudan'],
+    'STP': ['Sao Tome', 'Sao Tome and Principe'],
+    'SVK': ['Slovakia'],
+    'SYR': ['Syria'],
+    'TLS': ['East Timor'],
+    'TTO': ['Trinidad-Tobago'],
+    'TUR': ['Turkey', 'Turkiye'],
+    'TZA': ['United Republic of Tanzania'],
+    'USA': ['USA', 'America', 'United States of America'],
+    'VEN': ['Venezuela'],
+    'VNM': ['Vietnam'],
+    'YEM': ['Yemen'],
+}
+
+# Columns every ingested table with a country column gets: the dimension's integer key (-1 when the name is unknown,
+# e.g. for regional aggregates) and the ISO3 code
+KEY_COLUMN = 'Country Key'
+ISO3_COLUMN = 'ISO3'
+
+
+def normalize(name):
+    return ' '.join(str(name).split()).casefold()
+
+
+class CountryDimension:
+    def __init__(self, metadata_path=METADATA_PATH):
+        # One row per economy, keyed by position in ISO3 order; World Bank aggregates (no region) are left out
+        metadata = pd.read_csv(metadata_path)
+        economies = metadata[metadata['Region'].notna()]
+        table = pd.DataFrame({
+            'iso3': economies['Country Code'].tolist() + list(EXTRA_COUNTRIES),
+            'name': economies['TableName'].tolist() + list(EXTRA_COUNTRIES.values()),
+            'region': economies['Region'].tolist() + [None] * len(EXTRA_COUNTRIES),
+        })
+        self.table = table.sort_values('iso3', ignore_index=True)
+        self.table.insert(0, 'key', np.arange(len(self.table)))
+        self.iso3_codes = self.table['iso3'].to_numpy(dtype=object)
+        self.names = self.table['name'].to_numpy(dtype=object)
+
+        key_of_code = dict(zip(self.table['iso3'], self.table['key']))
+        self._lookup = {}
+        for code, name, key in zip(self.table['iso3'], self.table['name'], self.table['key']):
+            self._lookup[normalize(code)] = key
+            self._lookup[normalize(name)] = key
+        for code, aliases in ALIASES.items():
+            for alias in aliases:
+                self._lookup[normalize(alias)] = key_of_code[code]
+
+    def key(self, name):
+        return self._lookup.get(normalize(name), -1)
+
+    def keys(self, names):
+        # Integer keys for a column of names or codes; each distinct spelling is looked up once
+        codes, uniques = pd.factorize(pd.Series(names, dtype=object))
+        lookup = np.array([self.key(name) for name in uniques] + [-1], dtype=np.int64)
+        return lookup[codes]
+
+    def iso3(self, keys):
+        keys = np.asarray(keys)
+        return np.where(keys >= 0, self.iso3_codes[np.maximum(keys, 0)], None)
+
+
+def country_dimension(metadata_path=METADATA_PATH):
+    # Rebuilt whenever the metadata file changes on disk
+    stat = os.stat(metadata_path)
+    return _country_dimension(metadata_path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=2)
+def _country_dimension(metadata_path, mtime_ns, size):
+    return CountryDimension(metadata_path)
+
+
+def dimension_hash(metadata_path=METADATA_PATH):
+    # Fingerprint of everything the country keys depend on: the metadata file, EXTRA_COUNTRIES and ALIASES. Ingest
+    # stores it with each keyed table and rebuilds the table when it changes
+    stat = os.stat(metadata_path)
+    return _dimension_hash(metadata_path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=2)
+def _dimension_hash(metadata_path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(metadata_path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps([EXTRA_COUNTRIES, ALIASES], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def add_country_keys(df, column, dimension=None):
+    dimension = dimension or country_dimension()
+    keys = dimension.keys(df[column])
+    df[KEY_COLUMN] = keys
+    df[ISO3_COLUMN] = dimension.iso3(keys)
+    return df
+
+
+def country_totals(df, value_column):
+    # Sums a value per country on the integer keys, labelled with ISO3 code and canonical name; rows whose country
+    # isn't in the dimension are dropped
+    dimension = country_dimension()
+    known = df[KEY_COLUMN].to_numpy() >= 0
+    totals = df[known].groupby(KEY_COLUMN)[value_column].sum()
+    keys = totals.index.to_numpy()
+    return pd.DataFrame({
+        'Country': dimension.names[keys],
+        ISO3_COLUMN: dimension.iso3_codes[keys],
+        value_column: totals.to_numpy()
+    })
@@ -1,17 +1,23 @@
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, Patch
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
-import pandas as pd
 from dash_bootstrap_components.themes import BOOTSTRAP
 from flask import Flask
 from milexpend import prepare_and_plot_data
-from investment_tracker import generate_cumulative_investment_chart
+from investment_tracker import GRANULARITIES, load_investment_cube, windowed_investment_figure
 import dash_bootstrap_components as dbc
 
-from datamanager import DataManager, TreeDiagram
+from datamanager import DatasetRegistry, TreeDiagram
 from mapper import CombinedMap
+from base_map import MilitaryBasesMap
 from alliance_map import AllianceMap
 from gdp import GDPVisualizer
+from panel import METRICS, PANEL_SOURCES, cross_section_figure, load_panel
+from cache import FigureCache, LRUCache, file_signature
+from pages import PageRegistry
+from scheduler import FigureScheduler
+from spatial import viewport
 
 # Initializing the Flask server
 server = Flask(__name__)
@@ -29,16 +35,38 @@ dataset_paths = {
     "military_expenditure": 'data/SIPRI-Milex-data-1992-2023.xlsx',
     'investment_tracker': 'data/China-Global-Investment-Tracker-2023-Fall.xlsx',
     'alliances': 'data/US_China_Alliances_Partnerships.csv',
-    'GDP': 'data/API_NY.GDP.MKTP.CD_DS2_en_csv_v2_240389.csv'
+    'GDP': 'data/API_NY.GDP.MKTP.CD_DS2_en_csv_v2_240389.csv',
+    'GDP_metadata': 'data/Metadata_Country_API_NY.GDP.MKTP.CD_DS2_en_csv_v2_240389.csv'
 }
 
-# Initialize data managers
-data_manager = DataManager(dataset_paths['combined'])
-combined_map = CombinedMap(dataset_paths['investments'], dataset_paths['construction'], dataset_paths['combined'])
-gdp_visualizer = GDPVisualizer(app, dataset_paths['GDP'])
+bases_path = 'data/Overseas Military Bases.xlsx'
 
-# Preprocess map data
-combined_map.preprocess_data()
+# Simplification tolerance (degrees) for country outlines; invisible at dashboard zoom levels but much lighter
+geometry_tolerance = 0.01
+
+# Initialize data managers; only the investment/construction CSVs fit the sunburst. Nothing is read here: each page
+# loads on first use, or earlier from the background warm-up started by the first request
+sunburst_datasets = {name: dataset_paths[name] for name in ('combined', 'construction', 'investments')}
+dataset_registry = DatasetRegistry(sunburst_datasets)
+# The GDP page filters in the browser: the whole matrix, aggregates included, is sent once with the page
+gdp_visualizer = GDPVisualizer(app, dataset_paths['GDP'], lazy=True, metadata_path=dataset_paths['GDP_metadata'],
+                               client_side=True)
+
+# Built figures are reused across page views until one of their source files changes on disk
+figure_cache = FigureCache(max_size=16)
+figure_scheduler = FigureScheduler(figure_cache, interval=60)
+# The investment tracker chart is cut from this cube per request, one date window at a time
+investment_cubes = LRUCache(max_size=2)
+# The alliance map keeps its per-year status matrix here so the year slider can patch in a new z array
+alliance_maps = LRUCache(max_size=2)
+# The investment map keeps its per-layer country totals here so the layer selector can patch in another one
+combined_maps = LRUCache(max_size=2)
+# Spatially indexed base points, which the map page streams one viewport at a time
+bases_maps = LRUCache(max_size=2)
+# Country-year panel joining investment, GDP, military spending and alliances; its page only slices these arrays
+dime_panels = LRUCache(max_size=2)
+
+pages = PageRegistry()
 
 # Columns for the hierarchy selector in Sunburst view
 all_columns = ['Country', 'Sector', 'Subsector', 'Investor', 'Transaction Party', 'Region']
@@ -51,7 +79,8 @@ navbar = dbc.Nav(
         dbc.NavLink("Military Expenditure Analysis", href="/military-expenditure", active="exact"),
         dbc.NavLink("Cumulative Chinese Investments By Sector", href="/investment-tracker", active="exact"),
         dbc.NavLink("US-China Alliances and Partnerships", href="/alliances", active="exact"),
-        dbc.NavLink("GDP Visualizer", href="/gdp", active="exact")
+        dbc.NavLink("GDP Visualizer", href="/gdp", active="exact"),
+        dbc.NavLink("Country-Year DIME Panel", href="/dime-panel", active="exact")
     ],
     vertical=True,
     pills=True,  # This option gives a highlight to active link
@@ -67,87 +96,249 @@ app.layout = html.Div([
 ], style={'backgroundColor': '#303030', 'color': '#FFFFFF'})
 
 
+def combined_map():
+    paths = [dataset_paths['investments'], dataset_paths['construction'], dataset_paths['combined'], bases_path]
+
+    def build():
+        investment_map = CombinedMap(*paths, geometry_tolerance)
+        investment_map.preprocess_data()
+        return investment_map
+
+    return combined_maps.get_or_build(file_signature(*paths), build)
+
+
+def build_map_figure():
+    fig = combined_map().create_map()
+    fig.update_layout(mapbox_style="dark", height=700)  # Update the map style and height
+    # Keep the user's pan and zoom when the points are patched in
+    fig.update_layout(uirevision='map')
+    return fig
+
+
+def map_figure():
+    return figure_cache.get_figure('/map', [dataset_paths['investments'], dataset_paths['construction'],
+                                            dataset_paths['combined'], bases_path], build_map_figure)
+
+
+# The animated chart is the expensive one: the scheduler builds it in the background at startup and again whenever its
+# workbook changes, publishing each new version atomically
+figure_scheduler.add('/military-expenditure', [dataset_paths['military_expenditure']],
+                     lambda: prepare_and_plot_data(dataset_paths['military_expenditure']))
+
+
+def scheduled_figure(route):
+    for job_route, source_paths, builder in figure_scheduler.jobs:
+        if job_route == route:
+            return figure_cache.get_figure(route, source_paths, builder)
+    raise KeyError(route)
+
+
+def bases_map():
+    return bases_maps.get_or_build(file_signature(bases_path), lambda: MilitaryBasesMap(bases_path))
+
+
+def investment_cube():
+    path = dataset_paths['investment_tracker']
+    return investment_cubes.get_or_build(file_signature(path), lambda: load_investment_cube(path))
+
+
+def alliance_map():
+    path = dataset_paths['alliances']
+    return alliance_maps.get_or_build(file_signature(path),
+                                      lambda: AllianceMap(path, simplify_tolerance=geometry_tolerance))
+
+
+def dime_panel():
+    return dime_panels.get_or_build(file_signature(*PANEL_SOURCES.values()), load_panel)
+
+
+def alliances_figure():
+    return figure_cache.get_figure('/alliances', [dataset_paths['alliances']], lambda: alliance_map().create_map())
+
+
+@pages.route('/map', warm_up=map_figure)
+def map_page():
+    return html.Div([
+        html.H1("Map of Chinese Investments and World Overseas Military Bases", style={'color': 'white'}),
+        html.P("The map shows overseas military bases around the world and Chinese investments worldwide. Select "
+               "between Chinese investments, construction, and combined expenditures."),
+        dcc.RadioItems(
+            id='map-layer',
+            options=[{'label': title, 'value': layer} for layer, title in CombinedMap.layers.items()],
+            value='investments',
+            inline=True,
+            inputStyle={'margin-right': '5px', 'margin-left': '15px'}
+        ),
+        dcc.Graph(id='map-graph', figure=map_figure(), style={'height': '80vh'})
+    ])
+
+
+@pages.route('/sunburst', warm_up=dataset_registry.preload)
+def sunburst_page():
+    return html.Div([
+        html.H1("China Investments and Construction Sunburst", className="text-light"),
+        html.P("The sunburst chart shows the hierarchy of Chinese investments and construction projects. "
+               "Explore the dataset by drilling down through the different categories."),
+        dcc.Dropdown(
+            id='dataset-selector',
+            options=[{'label': k, 'value': v} for k, v in sunburst_datasets.items()],
+            value=dataset_paths['combined'],
+            clearable=False,
+            className="mb-3",
+            style={'color': '#000000'}  # Dark text color
+        ),
+        dcc.Dropdown(
+            id='hierarchy-selector',
+            options=[{'label': col, 'value': col} for col in all_columns],
+            value=['Country', 'Sector'],
+            multi=True,
+            className="mb-3",
+            style={'color': '#000000'}  # Dark text color
+        ),
+        html.H3(id='sunburst-title', className="text-light"),
+        dcc.Graph(id='tree-diagram', style={'height': '60vh'}),
+        # Holds only a key into the server-side dataset registry, not the data itself
+        dcc.Store(id='stored-data', data=dataset_registry.register(dataset_paths['combined'])),
+        dcc.Store(id='current-path', data=[]),
+        html.Button("Back", id="back-button", n_clicks=0, className="btn btn-secondary"),
+        html.Div(id="path-display", className="text-light")
+    ])
+
+
+@pages.route('/military-expenditure')
+def military_expenditure_page():
+    return html.Div([
+        html.H1("Military Expenditure Analysis"),
+        html.P("The chart shows military expenditure as a share of GDP over time for selected countries in the "
+               "Indo-Pacific."),
+        dcc.Graph(figure=scheduled_figure('/military-expenditure'), style={'height': '70vh'})
+    ])
+
+
+@pages.route('/investment-tracker', warm_up=investment_cube)
+def investment_tracker_page():
+    months = investment_cube()[0]
+    first_year, last_year = months[0].year, months[-1].year
+    return html.Div([
+        html.H1("Cumulative Investments of the PRC Globally"),
+        html.P("The chart shows cumulative investments of the PRC globally by region and sector over time. Pick the "
+               "years to animate and how far apart the frames should be; windows too long for that spacing are "
+               "animated at a coarser one, which the chart title names."),
+        dcc.RangeSlider(
+            id='investment-years',
+            min=first_year,
+            max=last_year,
+            step=1,
+            value=[first_year, last_year],
+            marks={year: str(year) for year in range(first_year, last_year + 1)},
+            className="mb-3"
+        ),
+        dcc.RadioItems(
+            id='investment-granularity',
+            options=[{'label': granularity.capitalize(), 'value': granularity} for granularity in GRANULARITIES],
+            value='quarterly',
+            inline=True,
+            inputStyle={'margin-right': '5px', 'margin-left': '15px'}
+        ),
+        dcc.Graph(id='investment-chart', style={'height': '70vh'})
+    ])
+
+
+@pages.route('/alliances', warm_up=alliances_figure)
+def alliances_page():
+    years = alliance_map().years
+    # The year slider only appears when the alliance table carries start/end years
+    year_slider = [] if len(years) < 2 else [dcc.Slider(
+        id='alliance-year',
+        min=int(years[0]),
+        max=int(years[-1]),
+        step=1,
+        value=int(years[-1]),
+        marks={int(year): str(year) for year in years[::5]},
+        className="mb-3"
+    )]
+    return html.Div([
+        html.H1("US Alliances and Chinese Partnerships Map"),
+        html.P("The map shows US alliances and Chinese partnerships with other countries. Countries in purple "
+               "have both US and China as partners."),
+        *year_slider,
+        dcc.Graph(id='alliance-map', figure=alliances_figure(), style={'height': '70vh'})
+    ])
+
+
+@pages.route('/gdp', warm_up=gdp_visualizer.ensure_loaded)
+def gdp_page():
+    return html.Div([
+        html.H1("GDP Visualizer", className="text-light"),
+        html.P("The GDP visualizer allows you to compare GDP over time for different countries."),
+        html.Div(gdp_visualizer.app_layout)
+    ])
+
+
+@pages.route('/dime-panel', warm_up=dime_panel)
+def dime_panel_page():
+    panel = dime_panel()
+    first_year, last_year = int(panel.years[0]), int(panel.years[-1])
+    options = [{'label': label, 'value': metric} for metric, label in METRICS.items() if metric != 'alignment']
+    x_metric, y_metric = 'investment_share_gdp', 'military_expenditure_share_gdp'
+    # Open on the latest year both default metrics cover
+    year = min(panel.data_years(x_metric)[1], panel.data_years(y_metric)[1])
+    return html.Div([
+        html.H1("Country-Year DIME Panel"),
+        html.P("Compares countries on two diplomatic, military and economic measures in a given year. Markers are "
+               "colored by alignment: blue for US allies, red for Chinese partners and purple for both."),
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id='panel-x-metric', options=options, value=x_metric, clearable=False,
+                                 style={'color': '#000000'})),
+            dbc.Col(dcc.Dropdown(id='panel-y-metric', options=options, value=y_metric, clearable=False,
+                                 style={'color': '#000000'})),
+        ], className="mb-3"),
+        dcc.RadioItems(
+            id='panel-scale',
+            options=[{'label': 'Linear Scale', 'value': 'linear'}, {'label': 'Logarithmic Scale', 'value': 'log'}],
+            value='linear',
+            inline=True,
+            inputStyle={'margin-right': '5px', 'margin-left': '15px'}
+        ),
+        dcc.Slider(
+            id='panel-year',
+            min=first_year,
+            max=last_year,
+            step=1,
+            value=year,
+            marks={mark: str(mark) for mark in range(first_year, last_year + 1, 5)},
+            className="mb-3"
+        ),
+        dcc.Graph(id='panel-chart', style={'height': '70vh'})
+    ])
+
+
+def landing_page():
+    return html.Div([
+        html.H1("Welcome to the PRC/US Great Power Competition Dashboard", className="text-light"),
+        html.Br(),
+        html.Img(src="/assets/landing_image.png", style={'width': '80%'})
+    ])
+
+
+@server.before_request
+def start_warm_up():
+    # The first request starts loading every page in the background instead of the import doing it up front
+    figure_scheduler.start()
+    pages.start_warm_up()
+
+
 @app.callback(Output('page-content', 'children'),
               [Input('url', 'pathname')])
 def display_page(pathname):
-    if pathname == '/map':
-        fig = combined_map.create_map()
-        fig.update_layout(mapbox_style="dark", height=700)  # Update the map style and height
-        return html.Div([
-            html.H1("Map of Chinese Investments and World Overseas Military Bases", style={'color': 'white'}),
-            html.P("The map shows overseas military bases around the world and Chinese investments worldwide. Select "
-                   "between Chinese investments, construction, and combined expenditures."),
-            dcc.Graph(figure=fig, style={'height': '80vh'})
-        ])
-    elif pathname == '/sunburst':
-        return html.Div([
-            html.H1("China Investments and Construction Sunburst", className="text-light"),
-            html.P("The sunburst chart shows the hierarchy of Chinese investments and construction projects. "
-                   "Explore the dataset by drilling down through the different categories."),
-            dcc.Dropdown(
-                id='dataset-selector',
-                options=[{'label': k, 'value': v} for k, v in dataset_paths.items()],
-                value=dataset_paths['combined'],
-                clearable=False,
-                className="mb-3",
-                style={'color': '#000000'}  # Dark text color
-            ),
-            dcc.Dropdown(
-                id='hierarchy-selector',
-                options=[{'label': col, 'value': col} for col in all_columns],
-                value=['Country', 'Sector'],
-                multi=True,
-                className="mb-3",
-                style={'color': '#000000'}  # Dark text color
-            ),
-            html.H3(id='sunburst-title', className="text-light"),
-            dcc.Graph(id='tree-diagram', style={'height': '60vh'}),
-            dcc.Store(id='stored-data', data=data_manager.get_data().to_json(date_format='iso', orient='split')),
-            dcc.Store(id='current-path', data=[]),
-            html.Button("Back", id="back-button", n_clicks=0, className="btn btn-secondary"),
-            html.Div(id="path-display", className="text-light")
-        ])
-    elif pathname == '/military-expenditure':
-        fig = prepare_and_plot_data(dataset_paths['military_expenditure'])
-        return html.Div([
-            html.H1("Military Expenditure Analysis"),
-            html.P("The chart shows military expenditure as a share of GDP over time for selected countries in the "
-                   "Indo-Pacific."),
-            dcc.Graph(figure=fig, style={'height': '70vh'})
-        ])
-    elif pathname == '/investment-tracker':
-        fig = generate_cumulative_investment_chart(dataset_paths['investment_tracker'])
-        return html.Div([
-            html.H1("Cumulative Investments of the PRC Globally"),
-            html.P("The chart shows cumulative investments of the PRC globally by region and sector over time."),
-            dcc.Graph(figure=fig, style={'height': '70vh'})
-        ])
-    elif pathname == '/alliances':
-        fig = AllianceMap(dataset_paths['alliances']).create_map()
-        return html.Div([
-            html.H1("US Alliances and Chinese Partnerships Map"),
-            html.P("The map shows US alliances and Chinese partnerships with other countries. Countries in purple "
-                   "have both US and China as partners."),
-            dcc.Graph(figure=fig, style={'height': '70vh'})
-        ])
-    elif pathname == '/gdp':
-        return html.Div([
-            html.H1("GDP Visualizer", className="text-light"),
-            html.P("The GDP visualizer allows you to compare GDP over time for different countries."),
-            html.Div(gdp_visualizer.app_layout)
-        ])
-    else:
-        return html.Div([
-            html.H1("Welcome to the PRC/US Great Power Competition Dashboard", className="text-light"),
-            html.Br(),
-            html.Img(src="/assets/landing_image.png", style={'width': '80%'})
-        ])
+    return pages.render(pathname, landing_page)
 
 
 @app.callback(
     [Output('tree-diagram', 'figure'),
      Output('current-path', 'data'),
-     Output('sunburst-title', 'children')],
+     Output('sunburst-title', 'children'),
+     Output('stored-data', 'data')],
     [Input('dataset-selector', 'value'),
      Input('tree-diagram', 'clickData'),
      Input('back-button', 'n_clicks'),
@@ -155,41 +346,113 @@ def display_page(pathname):
     [State('stored-data', 'data'),
      State('current-path', 'data')]
 )
-def update_graph(dataset_path, clickData, back_clicks, selected_hierarchy, json_data, current_path):
+def update_graph(dataset_path, clickData, back_clicks, selected_hierarchy, dataset_key, current_path):
     ctx = dash.callback_context
     triggered_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    data = pd.read_json(json_data, orient='split')
 
     if triggered_id == 'dataset-selector':
-        _data_manager = DataManager(dataset_path)
-        data = _data_manager.get_data()
-        json_data = data.to_json(date_format='iso', orient='split')
+        if dataset_path not in dataset_registry:
+            raise PreventUpdate
+        dataset_key = dataset_registry.register(dataset_path)
         current_path = []  # Reset the path for new data
+    data = dataset_registry.get(dataset_key)
+    cube = dataset_registry.cube(dataset_key)
 
     if 'back-button' in triggered_id and current_path:
         current_path.pop()
     elif clickData and 'tree-diagram' in triggered_id:
         current_path.append(clickData['points'][0]['label'])
 
-    if not current_path:
-        filtered_data = data
-        next_level = selected_hierarchy[:1]
-    else:
-        filtered_data = data
-        for i, level in enumerate(current_path):
-            filtered_data = filtered_data[filtered_data[selected_hierarchy[i]] == level]
-        next_index = len(current_path)
-        next_level = selected_hierarchy[next_index:next_index + 1] if next_index < len(selected_hierarchy) else []
+    next_index = len(current_path)
+    next_level = selected_hierarchy[next_index:next_index + 1] if next_index < len(selected_hierarchy) else []
 
-    if not next_level:
+    if not next_level or not set(selected_hierarchy[:next_index + 1]) <= set(data.columns):
         fig = go.Figure()
         title_text = "Select a node to see further details"
     else:
-        tree_diagram = TreeDiagram(filtered_data)
+        # Next-level totals come precomputed from the cube rather than re-filtering the full frame
+        tree_diagram = TreeDiagram(cube.children(selected_hierarchy, current_path))
         fig = tree_diagram.create_tree(next_level)
         title_text = " > ".join(current_path) if current_path else " > ".join(selected_hierarchy[:1])
 
-    return fig, current_path, title_text
+    return fig, current_path, title_text, dataset_key
+
+
+@app.callback(
+    Output('investment-chart', 'figure'),
+    [Input('investment-years', 'value'),
+     Input('investment-granularity', 'value')]
+)
+def update_investment_chart(year_range, granularity):
+    # Only the frames inside the chosen window are serialized, at a spacing coarse enough to stay within MAX_FRAMES
+    if not year_range or granularity not in GRANULARITIES:
+        raise PreventUpdate
+    months, regions, sectors, cube = investment_cube()
+    first_year, last_year = year_range
+    return windowed_investment_figure(months, regions, sectors, cube, f"{first_year}-01-01", f"{last_year}-12-31",
+                                      granularity)
+
+
+@app.callback(
+    Output('map-graph', 'figure'),
+    [Input('map-graph', 'relayoutData')],
+    prevent_initial_call=True
+)
+def stream_base_points(relayout_data):
+    # Only the bases inside the new viewport are sent, clustered when there are too many to draw one by one
+    view = viewport(relayout_data)
+    if view is None:
+        raise PreventUpdate
+    points = bases_map().layer()['points'].view(*view)
+    figure = Patch()
+    trace = figure['data'][CombinedMap.bases_trace]
+    trace['lat'] = points['lat']
+    trace['lon'] = points['lon']
+    trace['hovertext'] = points['hovertext']
+    trace['marker']['color'] = points['color']
+    trace['marker']['size'] = points['size']
+    return figure
+
+
+@app.callback(
+    Output('map-graph', 'figure', allow_duplicate=True),
+    [Input('map-layer', 'value')],
+    prevent_initial_call=True
+)
+def update_map_layer(layer):
+    # The layer is chosen on the server rather than by a client-side button, so the figure Dash holds always has the
+    # layer on screen and the viewport patches to the bases trace can't bring back the first one
+    if layer not in CombinedMap.layers:
+        raise PreventUpdate
+    properties, title = combined_map().layer_update(layer)
+    figure = Patch()
+    for name, value in properties.items():
+        figure['data'][0][name] = value
+    figure['layout']['title']['text'] = title
+    return figure
+
+
+@app.callback(
+    Output('alliance-map', 'figure'),
+    [Input('alliance-year', 'value')],
+    prevent_initial_call=True
+)
+def update_alliance_year(year):
+    # Only the choropleth's z values change between years; geometry, hover text and layout stay on the client
+    figure = Patch()
+    figure['data'][0]['z'] = alliance_map().status_for(year)
+    return figure
+
+
+@app.callback(
+    Output('panel-chart', 'figure'),
+    [Input('panel-x-metric', 'value'),
+     Input('panel-y-metric', 'value'),
+     Input('panel-year', 'value'),
+     Input('panel-scale', 'value')]
+)
+def update_dime_panel(x_metric, y_metric, year, scale):
+    return cross_section_figure(dime_panel(), x_metric, y_metric, year, scale)
 
 
 @app.callback(
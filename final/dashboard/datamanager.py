@@ -1,15 +1,183 @@
+import threading
+
+import numpy as np
 import plotly.graph_objects as go
 import pandas as pd
+from cache import LRUCache, file_signature
+from ingest import load_source, load_source_tail, source_entry
 
 
 class DataManager:
     def __init__(self, filepath):
-        self.data = pd.read_csv(filepath)
+        self.data = load_source(filepath)
+        # Categorical string columns keep repeated labels compact and make grouping cheaper
+        for column in self.data.columns:
+            if not pd.api.types.is_numeric_dtype(self.data[column]):
+                self.data[column] = self.data[column].astype('category')
 
     def get_data(self):
         return self.data
 
 
+def concat_rows(data, rows):
+    # Appends rows to a DataManager frame, widening each categorical column's categories to take in new labels. The
+    # original frame is left untouched for readers that still hold it
+    data = data.copy(deep=False)
+    rows = rows.reset_index(drop=True)
+    for column in data.columns:
+        if isinstance(data[column].dtype, pd.CategoricalDtype):
+            categories = data[column].cat.categories.union(pd.Index(rows[column].dropna().unique()))
+            data[column] = data[column].cat.set_categories(categories)
+            rows[column] = pd.Categorical(rows[column], categories=categories)
+    return pd.concat([data, rows], ignore_index=True)
+
+
+class AggregationCube:
+    def __init__(self, data, value_column='Quantity in Millions', max_levels=32):
+        self.data = data
+        self.value_column = value_column
+        self._levels = LRUCache(max_levels)
+
+    def level(self, columns):
+        # Levels are built the first time a hierarchy prefix is requested and shared by every order that starts with it
+        columns = tuple(columns)
+        return self._levels.get_or_build(columns, lambda: self._build_level(columns))
+
+    def _build_level(self, columns):
+        totals = self.data.groupby(list(columns), observed=True)[self.value_column].sum().reset_index()
+        return self._index_level(columns, totals)
+
+    @staticmethod
+    def _index_level(columns, totals):
+        if len(columns) == 1:
+            positions = {(): np.arange(len(totals))}
+        else:
+            # Row positions of each parent path's children, so a drill-down is a dict lookup instead of a scan
+            prefixes = totals[list(columns[:-1])].astype(str)
+            positions = {key if isinstance(key, tuple) else (key,): rows
+                         for key, rows in prefixes.groupby(list(columns[:-1])).indices.items()}
+        return totals, positions
+
+    def extend(self, rows):
+        # A cube over the data plus the new rows. Levels already built are merged with the new rows' totals rather
+        # than re-aggregated, so the cost follows the number of new rows and the size of the levels, not the history
+        data = concat_rows(self.data, rows)
+        rows = data.iloc[len(self.data):]
+        extended = AggregationCube(data, self.value_column, self._levels.max_size)
+        for columns, (totals, _) in self._levels.items():
+            key_columns = list(columns)
+            added = rows.groupby(key_columns, observed=True)[self.value_column].sum().reset_index()
+            merged = pd.concat([totals.astype({column: data[column].dtype for column in key_columns}), added])
+            merged = merged.groupby(key_columns, observed=True)[self.value_column].sum().reset_index()
+            extended._levels.put(columns, self._index_level(columns, merged))
+        return extended
+
+    def children(self, hierarchy, path):
+        # Totals of the next hierarchy level beneath the drilled-down path
+        columns = tuple(hierarchy[:len(path) + 1])
+        totals, positions = self.level(columns)
+        rows = positions.get(tuple(path))
+        totals = totals[[columns[-1], self.value_column]]
+        if rows is None:
+            return totals.iloc[0:0]
+        return totals.iloc[rows]
+
+
+class DatasetRegistry:
+    value_column = 'Quantity in Millions'
+
+    def __init__(self, dataset_paths):
+        for name, path in dataset_paths.items():
+            if not path.endswith('.csv'):
+                raise ValueError(f"Dataset '{name}' ({path}) is not a tabular CSV and cannot back the sunburst")
+        self.dataset_paths = dict(dataset_paths)
+        self._datasets = {}
+        self._lock = threading.Lock()
+
+    def preload(self):
+        for path in self.dataset_paths.values():
+            self.register(path)
+
+    def __contains__(self, path):
+        return path in self.dataset_paths.values()
+
+    @staticmethod
+    def version(path):
+        _, mtime, size = file_signature(path)[0]
+        return f"{mtime}-{size}"
+
+    def register(self, path):
+        # Returns the small key that the browser keeps in place of the data itself
+        if path not in self:
+            raise ValueError(f"{path} is not a registered sunburst dataset")
+        version = self.version(path)
+        with self._lock:
+            loaded = self._datasets.get(path)
+            if loaded is None or loaded[0] != version:
+                self._datasets[path] = self._extend(path, loaded, version) or self._load_entry(path, version)
+        return {'path': path, 'version': version}
+
+    def _load_entry(self, path, version):
+        data = self.load(path)
+        return version, data, AggregationCube(data, self.value_column)
+
+    def _extend(self, path, loaded, version):
+        # When the file only had rows appended since the loaded version (see ingest.append_table), fold just those rows
+        # into the loaded data and cube; any other change reloads the dataset in full
+        entry = source_entry(path)
+        base = entry.get('base') if entry else None
+        if loaded is None or not base or f"{entry['mtime_ns']}-{entry['size']}" != version:
+            return None
+        _, data, cube = loaded
+        if f"{base['mtime_ns']}-{base['size']}" != loaded[0] or base['rows'] != len(data):
+            return None
+        rows = load_source_tail(path, base['rows'])
+        cube = cube.extend(rows)
+        return version, cube.data, cube
+
+    def load(self, path):
+        data = DataManager(path).get_data()
+        if self.value_column not in data.columns:
+            raise ValueError(f"{path} has no '{self.value_column}' column")
+        return data
+
+    def _entry(self, key):
+        # A key with an outdated version resolves to the file's current contents
+        path = key['path']
+        with self._lock:
+            loaded = self._datasets.get(path)
+        if loaded is None or loaded[0] != self.version(path):
+            self.register(path)
+            with self._lock:
+                loaded = self._datasets[path]
+        return loaded
+
+    def get(self, key):
+        return self._entry(key)[1]
+
+    def cube(self, key):
+        return self._entry(key)[2]
+
+
+def build_hierarchy(data, path, value_column='Quantity in Millions'):
+    # Aggregate the leaves once, then roll each shallower level up from the (much smaller) leaf totals
+    leaves = data.groupby(path, observed=True)[value_column].sum().reset_index()
+    keys = leaves[path].astype(str)
+
+    levels = []
+    for depth in range(len(path)):
+        level = keys[path[:depth + 1]].assign(value=leaves[value_column])
+        level = level.groupby(path[:depth + 1], sort=False)['value'].sum().reset_index()
+        parents = pd.Series('', index=level.index)
+        ids = level[path[0]]
+        for col in path[1:depth + 1]:
+            parents = ids
+            ids = ids + '/' + level[col]
+        levels.append(pd.DataFrame({'id': ids, 'label': level[path[depth]], 'parent': parents,
+                                    'value': level['value']}))
+    return pd.concat(levels, ignore_index=True)
+
+
 class TreeDiagram:
     def __init__(self, data):
         self.data = data
@@ -17,31 +185,14 @@ class TreeDiagram:
     def create_tree(self, hierarchy_columns):
         # Generate hierarchical data
         path = [col for col in hierarchy_columns if col in self.data.columns]
-        values = self.data.groupby(path)['Quantity in Millions'].sum().reset_index()
-
-        # Building the hierarchy for the sunburst chart
-        labels = []
-        parents = []
-        ids = []
-
-        for row in zip(*[values[col] for col in path]):
-            for i in range(len(row)):
-                id_path = "/".join(row[:i + 1])
-                parent_path = "/".join(row[:i])
-                if id_path not in ids:
-                    ids.append(id_path)
-                    labels.append(row[i])
-                    parents.append(parent_path if i > 0 else "")
+        nodes = build_hierarchy(self.data, path)
 
         fig = go.Figure(go.Sunburst(
-            labels=labels,
-            parents=parents,
-            values=values['Quantity in Millions'],
+            ids=nodes['id'],
+            labels=nodes['label'],
+            parents=nodes['parent'],
+            values=nodes['value'],
             branchvalues="total"
         ))
         fig.update_layout(margin=dict(t=0, l=0, r=0, b=0))
         return fig
-
-
-
-
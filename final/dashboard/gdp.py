@@ -1,36 +1,139 @@
-import pandas as pd
+import base64
+import threading
+
+import numpy as np
 import plotly.graph_objects as go
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State
+from ingest import load_source
+
+# Client-side version of update_graph: decodes the float32 matrix shipped in the 'gdp-data' store once per page load and
+# slices it in the browser, so country, scale and year changes never reach the server
+CLIENT_UPDATE_GRAPH = """
+function(selectedCountries, selectedScale, selectedYears, data) {
+    if (!data) {
+        return window.dash_clientside.no_update;
+    }
+    const cache = window.gdpMatrixCache;
+    let gdp;
+    if (cache && cache.source === data.gdp) {
+        gdp = cache.gdp;
+    } else {
+        const bytes = Uint8Array.from(atob(data.gdp), c => c.charCodeAt(0));
+        gdp = new Float32Array(bytes.buffer);
+        window.gdpMatrixCache = {source: data.gdp, gdp: gdp};
+    }
+    const width = data.years.length;
+    const columns = [];
+    data.years.forEach((year, j) => {
+        if (year >= selectedYears[0] && year <= selectedYears[1]) {
+            columns.push(j);
+        }
+    });
+    const traces = (selectedCountries || []).filter(country => country in data.index).map(country => {
+        const row = data.index[country] * width;
+        return {
+            type: 'scatter',
+            mode: 'lines',
+            name: country,
+            x: columns.map(j => data.years[j]),
+            y: columns.map(j => gdp[row + j])
+        };
+    });
+    const layout = Object.assign({}, data.layout);
+    layout.yaxis = Object.assign({}, layout.yaxis, {type: selectedScale});
+    return {data: traces, layout: layout};
+}
+"""
 
 
 class GDPVisualizer:
-    def __init__(self, app, file_path):
+    relevant_countries = ['United States', 'China', 'Russian Federation', 'India', 'Japan', 'Korea, Rep.',
+                          'Australia', 'Philippines']
+
+    def __init__(self, app, file_path, lazy=False, metadata_path=None, client_side=False):
         self.app = app
         self.file_path = file_path
-        self.load_data()
-        self.setup_layout()
+        # World Bank country metadata; entities without a region there are aggregates (World, Euro area, ...)
+        self.metadata_path = metadata_path
+        # Ship the whole matrix to the browser once and filter there instead of in a server callback
+        self.client_side = client_side
+        self.gdp = None
+        self._app_layout = None
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.load_data()
         self.setup_callbacks()
 
+    def ensure_loaded(self):
+        with self._load_lock:
+            if self.gdp is None:
+                self.load_data()
+
     def load_data(self):
-        # Load the data
-        df = pd.read_csv(self.file_path, skiprows=4)
-        # Filter for relevant columns
-        df = df[['Country Name', 'Country Code'] + [str(year) for year in range(1960, 2023)]]
-        # Melt the DataFrame
-        self.df_melted = df.melt(id_vars=['Country Name', 'Country Code'], var_name='Year', value_name='GDP')
-        # Filter for relevant countries
-        self.relevant_countries = ['United States', 'China', 'Russian Federation', 'India', 'Japan', 'Korea, Rep.',
-                                   'Australia', 'Philippines']
-        self.df_filtered = self.df_melted[self.df_melted['Country Name'].isin(self.relevant_countries)]
+        df = load_source(self.file_path)
+        # Year columns that hold any data; the newest World Bank column is published empty
+        year_columns = [col for col in df.columns if col.isdigit() and df[col].notna().any()]
+        # Wide (country x year) matrix with lookups in both directions, so a callback only has to slice it
+        self.countries = df['Country Name'].astype(str).tolist()
+        self.country_index = {country: i for i, country in enumerate(self.countries)}
+        self.years = np.array([int(col) for col in year_columns])
+        self.year_index = {year: j for j, year in enumerate(self.years)}
+        self.gdp = df[year_columns].to_numpy(dtype=float)
+        self.aggregates = set()
+        if self.metadata_path:
+            metadata = load_source(self.metadata_path)
+            aggregate_codes = set(metadata.loc[metadata['Region'].isna(), 'Country Code'].astype(str))
+            self.aggregates = {country for country, code in zip(self.countries, df['Country Code'].astype(str))
+                               if code in aggregate_codes}
+
+    def country_options(self):
+        # Economies first, then the regional and income-group aggregates
+        economies = sorted(country for country in self.countries if country not in self.aggregates)
+        return ([{'label': country, 'value': country} for country in economies] +
+                [{'label': f"{country} (aggregate)", 'value': country} for country in sorted(self.aggregates)])
+
+    def figure_layout(self, selected_scale):
+        fig = go.Figure()
+        fig.update_layout(
+            title='GDP Over Time by Country',
+            xaxis_title='Year',
+            yaxis_title='GDP in US Dollars',
+            yaxis_type=selected_scale
+        )
+        return fig
+
+    def client_data(self):
+        # Little-endian float32 keeps the full matrix to under a hundred kilobytes of base64; missing years stay NaN
+        return {
+            'gdp': base64.b64encode(self.gdp.astype('<f4').tobytes()).decode('ascii'),
+            'years': self.years.tolist(),
+            'index': self.country_index,
+            'layout': self.figure_layout('log').to_plotly_json()['layout']
+        }
+
+    def year_slice(self, first_year, last_year):
+        # Columns for an inclusive year range, clipped to the years in the file
+        return slice(np.searchsorted(self.years, first_year, side='left'),
+                     np.searchsorted(self.years, last_year, side='right'))
+
+    @property
+    def app_layout(self):
+        # The country list comes from the data, so the layout is built on first use rather than at construction
+        self.ensure_loaded()
+        if self._app_layout is None:
+            self.setup_layout()
+        return self._app_layout
 
     def setup_layout(self):
-        self.app_layout = html.Div([
-            dcc.Checklist(
+        first_year, last_year = int(self.years[0]), int(self.years[-1])
+        self._app_layout = html.Div([
+            dcc.Dropdown(
                 id='country-selector',
-                options=[{'label': country, 'value': country} for country in self.relevant_countries],
-                value=self.relevant_countries,
-                inline=True,
-                inputStyle={"margin-right": "5px", "margin-left": "10px"},
+                options=self.country_options(),
+                value=[country for country in self.relevant_countries if country in self.country_index],
+                multi=True,
+                className="mb-3",
+                style={'color': '#000000'}
             ),
             dcc.RadioItems(
                 id='scale-selector',
@@ -43,16 +146,27 @@ class GDPVisualizer:
             ),
             dcc.RangeSlider(
                 id='year-slider',
-                min=1960,
-                max=2019,
-                value=[1960, 2019],
-                marks={str(year): str(year) for year in range(1960, 2023, 5)},
+                min=first_year,
+                max=last_year,
+                value=[first_year, last_year],
+                marks={str(year): str(year) for year in range(first_year, last_year + 1, 5)},
                 step=1
             ),
             dcc.Graph(id='gdp-line-graph'),
-        ])
+        ] + ([dcc.Store(id='gdp-data', data=self.client_data())] if self.client_side else []))
 
     def setup_callbacks(self):
+        if self.client_side:
+            self.app.clientside_callback(
+                CLIENT_UPDATE_GRAPH,
+                Output('gdp-line-graph', 'figure'),
+                [Input('country-selector', 'value'),
+                 Input('scale-selector', 'value'),
+                 Input('year-slider', 'value')],
+                [State('gdp-data', 'data')]
+            )
+            return
+
         @self.app.callback(
             Output('gdp-line-graph', 'figure'),
             [Input('country-selector', 'value'),
@@ -60,18 +174,12 @@ class GDPVisualizer:
              Input('year-slider', 'value')]
         )
         def update_graph(selected_countries, selected_scale, selected_years):
-            fig = go.Figure()
-            filtered_df = self.df_filtered[(self.df_filtered['Country Name'].isin(selected_countries)) &
-                                           (self.df_filtered['Year'].astype(int) >= selected_years[0]) &
-                                           (self.df_filtered['Year'].astype(int) <= selected_years[1])]
-            for country in selected_countries:
-                country_df = filtered_df[filtered_df['Country Name'] == country]
-                fig.add_trace(go.Scatter(x=country_df['Year'], y=country_df['GDP'], mode='lines', name=country))
-            fig.update_layout(
-                title='GDP Over Time by Country',
-                xaxis_title='Year',
-                yaxis_title='GDP in US Dollars',
-                yaxis_type=selected_scale
-            )
+            self.ensure_loaded()
+            fig = self.figure_layout(selected_scale)
+            columns = self.year_slice(*selected_years)
+            years = self.years[columns]
+            for country in selected_countries or []:
+                if country in self.country_index:
+                    fig.add_trace(go.Scatter(x=years, y=self.gdp[self.country_index[country], columns], mode='lines',
+                                             name=country))
             return fig
-
@@ -0,0 +1,153 @@
+import copy
+import json
+import os
+import sys
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+import requests
+from countries import country_dimension, dimension_hash
+
+# Natural Earth 1:110m admin-0 countries (public domain). A copy reduced to ids, names and 4-decimal coordinates is
+# bundled as data/countries.geo.json; `python geometry.py` refreshes it from this release
+GEOJSON_URL = ("https://raw.githubusercontent.com/nvkelso/natural-earth-vector/master/geojson/"
+               "ne_110m_admin_0_countries.geojson")
+GEOJSON_PATH = 'data/countries.geo.json'
+
+# The 1:110m outline set has 177 countries; anything much smaller is a truncated or placeholder file
+MIN_FEATURES = 150
+
+
+def _check_geojson(geojson, source):
+    features = geojson.get('features') if isinstance(geojson, dict) else None
+    if not features or len(features) < MIN_FEATURES or not all('id' in feature for feature in features):
+        raise ValueError(f"{source} is not a world country outline file: expected at least {MIN_FEATURES} features "
+                         f"with ISO3 ids, found {len(features or [])}")
+    return geojson
+
+
+def _outline_feature(feature):
+    # Natural Earth feature reduced to what the maps use. ISO_A3 is -99 for a few disputed or partly recognised
+    # countries, which fall back to Natural Earth's own ADM0_A3 code
+    properties = feature['properties']
+    iso3 = properties.get('ISO_A3', '-99')
+    return {
+        'type': 'Feature',
+        'id': iso3 if iso3 != '-99' else properties['ADM0_A3'],
+        'properties': {'name': properties['NAME']},
+        'geometry': {'type': feature['geometry']['type'],
+                     'coordinates': _round_coordinates(feature['geometry']['coordinates'])},
+    }
+
+
+def _round_coordinates(coordinates, decimals=4):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, decimals) for value in coordinates]
+    return [_round_coordinates(part, decimals) for part in coordinates]
+
+
+def fetch_geojson(path=GEOJSON_PATH, url=GEOJSON_URL):
+    # Downloads the outlines and saves them to path; raises if the download fails or doesn't look like the real file
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    geojson = {'type': 'FeatureCollection',
+               'features': [_outline_feature(feature) for feature in response.json().get('features', [])]}
+    _check_geojson(geojson, url)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(geojson, f, separators=(',', ':'))
+    os.replace(temp_path, path)
+    return geojson
+
+
+@lru_cache(maxsize=1)
+def _read_geojson(path):
+    # The outlines ship with the repository, so a missing file means a broken checkout rather than a first run
+    try:
+        with open(path) as f:
+            return _check_geojson(json.load(f), path)
+    except (OSError, ValueError) as error:
+        raise RuntimeError(f"Country outlines could not be read from {path}; restore the bundled file or run "
+                           f"`python geometry.py` to download it again") from error
+
+
+def load_countries_geojson(simplify_tolerance=None, path=GEOJSON_PATH):
+    # The returned dict is shared by every map in the process, so callers must not modify it. Feature ids are the
+    # country dimension's ISO3 codes, which match the ISO3 column ingest adds to every country table
+    return _load_countries_geojson(simplify_tolerance, path, dimension_hash())
+
+
+@lru_cache(maxsize=4)
+def _load_countries_geojson(simplify_tolerance, path, countries_hash):
+    geojson = copy.deepcopy(_read_geojson(path))
+    assign_dimension_ids(geojson['features'])
+    if simplify_tolerance:
+        for feature in geojson['features']:
+            feature['geometry'] = simplify_geometry(feature['geometry'], simplify_tolerance)
+    return geojson
+
+
+def assign_dimension_ids(features, dimension=None):
+    # Natural Earth ids aren't always ISO3 (its own codes such as SDS for South Sudan, or -99), so a feature whose id
+    # isn't a dimension code is matched on its id or name through the dimension and its aliases. A code another
+    # feature already has is left alone, e.g. Somaliland keeps its own id rather than taking Somalia's
+    dimension = dimension or country_dimension()
+    codes = set(dimension.iso3_codes)
+    taken = {feature['id'] for feature in features if feature['id'] in codes}
+    for feature in features:
+        if feature['id'] in codes:
+            continue
+        for label in (feature['id'], feature['properties'].get('name')):
+            key = dimension.key(label)
+            if key >= 0 and dimension.iso3_codes[key] not in taken:
+                feature['id'] = dimension.iso3_codes[key]
+                taken.add(feature['id'])
+                break
+    return features
+
+
+def simplify_geometry(geometry, tolerance):
+    if geometry['type'] == 'Polygon':
+        coordinates = [simplify_ring(ring, tolerance) for ring in geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        coordinates = [[simplify_ring(ring, tolerance) for ring in polygon] for polygon in geometry['coordinates']]
+    else:
+        return geometry
+    return {'type': geometry['type'], 'coordinates': coordinates}
+
+
+def simplify_ring(ring, tolerance):
+    # Douglas-Peucker on a closed ring; rings that would collapse are returned unchanged
+    points = np.asarray(ring, dtype=float)
+    if len(points) <= 4:
+        return ring
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = points[start + 1:end]
+        direction = points[end] - points[start]
+        offset = inner - points[start]
+        length = np.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(offset[:, 0], offset[:, 1])
+        else:
+            distances = np.abs(direction[0] * offset[:, 1] - direction[1] * offset[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    if keep.sum() < 4:
+        return ring
+    return np.round(points[keep], 4).tolist()
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else GEOJSON_PATH
+    print(f"{target}: {len(fetch_geojson(target)['features'])} country outlines")
@@ -0,0 +1,356 @@
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from countries import ISO3_COLUMN, KEY_COLUMN, add_country_keys, dimension_hash
+
+# Cleaned copies of the sources are written next to them as uncompressed Arrow IPC files, with a manifest of the source
+# hashes they came from. Tables are memory-mapped on load, so every worker process reads the same page-cache copy
+COLUMNAR_DIR = 'columnar'
+TABLE_SUFFIX = '.arrow'
+MANIFEST_FILE = 'manifest.json'
+# Bumped whenever cleaning changes, so tables written by an older version are rebuilt even if their source is unchanged
+INGEST_VERSION = 3
+
+LOCK_SUFFIX = '.lock'
+
+
+def _stringify_objects(df):
+    # Excel and CSV object columns can mix numbers and text; keep them as plain strings so they store as one type
+    for column in df.select_dtypes(include='object').columns:
+        df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+
+def clean_csv(path):
+    return pd.read_csv(path)
+
+
+def clean_gdp(path):
+    df = pd.read_csv(path, skiprows=4)
+    return df.drop(columns=[col for col in df.columns if col.startswith('Unnamed')])
+
+
+def clean_population_admin(path):
+    return pd.read_csv(path, skiprows=[0])
+
+
+def read_tracker_sheet(path, sheet):
+    # AEI tracker sheets open with a title block; the table starts below the row whose first cell is 'Year'
+    raw = pd.read_excel(path, sheet_name=sheet, header=None)
+    header_row = raw.index[raw.iloc[:, 0] == 'Year'][0]
+    df = raw.iloc[header_row + 1:].dropna(how='all').reset_index(drop=True)
+    df.columns = raw.iloc[header_row].tolist()
+    return df
+
+
+def clean_investment_tracker(path):
+    df = read_tracker_sheet(path, 3)
+    df['Year'] = pd.to_numeric(df['Year']).astype(int)
+    df['Quantity in Millions'] = pd.to_numeric(df['Quantity in Millions'], errors='coerce')
+    return df
+
+
+def clean_military_expenditure(path):
+    # Both SIPRI sheets in long form: one row per country and year, in the workbook's country order
+    sheets = []
+    for sheet_name, value_name in [("Current US$", 'USD'), ("Share of GDP", 'Share of GDP')]:
+        raw = pd.read_excel(path, sheet_name=sheet_name, skiprows=4)
+        years = raw.iloc[0, 2:].astype(int).to_numpy()
+        # Region headings ('Americas', 'East Asia', ...) have no values at all
+        rows = raw.iloc[1:].dropna(subset=raw.columns[2:], how='all')
+        values = rows.iloc[:, 2:].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        sheets.append(pd.DataFrame({
+            'Country': np.repeat(rows.iloc[:, 0].to_numpy(), len(years)),
+            'Year': np.tile(years, len(rows)),
+            value_name: values.ravel()
+        }))
+    return sheets[0].merge(sheets[1], on=['Country', 'Year'], how='left')
+
+
+def clean_military_bases(path):
+    return pd.read_excel(path, sheet_name='Overseas military base')
+
+
+CLEANERS = {
+    'Investments.csv': clean_csv,
+    'Construction.csv': clean_csv,
+    'Investments_and_construction.csv': clean_csv,
+    'US_China_Alliances_Partnerships.csv': clean_csv,
+    'demographics.csv': clean_csv,
+    'API_NY.GDP.MKTP.CD_DS2_en_csv_v2_240389.csv': clean_gdp,
+    'Metadata_Country_API_NY.GDP.MKTP.CD_DS2_en_csv_v2_240389.csv': clean_csv,
+    'Population__Households_and_Housing_Units_20240508191732.csv': clean_population_admin,
+    'China-Global-Investment-Tracker-2023-Fall.xlsx': clean_investment_tracker,
+    'SIPRI-Milex-data-1992-2023.xlsx': clean_military_expenditure,
+    'Overseas Military Bases.xlsx': clean_military_bases,
+}
+
+
+# Country column of each source; its table also carries the country dimension's key and ISO3 code for every row
+COUNTRY_COLUMNS = {
+    'Investments.csv': 'Country',
+    'Construction.csv': 'Country',
+    'Investments_and_construction.csv': 'Country',
+    'US_China_Alliances_Partnerships.csv': 'country2',
+    'API_NY.GDP.MKTP.CD_DS2_en_csv_v2_240389.csv': 'Country Code',
+    'SIPRI-Milex-data-1992-2023.xlsx': 'Country',
+    'Overseas Military Bases.xlsx': 'Country',
+}
+
+
+def _with_country_keys(name, df):
+    if name in COUNTRY_COLUMNS:
+        add_country_keys(df, COUNTRY_COLUMNS[name])
+    return df
+
+
+def _countries_hash(name):
+    # Country keys come from the country dimension, so a keyed table is also stale once the dimension changes
+    return dimension_hash() if name in COUNTRY_COLUMNS else None
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _columnar_dir(source_path):
+    return os.path.join(os.path.dirname(source_path) or '.', COLUMNAR_DIR)
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_atomic(path, write):
+    # write(temp_path) fills a uniquely named file beside path, which then replaces path in one step, so concurrent
+    # writers in any thread or process never share a temp file and readers never see a partial one
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.",
+                                     suffix='.tmp')
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+@contextmanager
+def file_lock(path):
+    # Exclusive flock on a lock file. It belongs to the open file, so it holds across worker processes as well as
+    # threads, each of which opens the file for itself
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _source_lock(source_path):
+    # One lock per source, so workers that cold-load the same table build it once while the others wait for it
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return file_lock(os.path.join(_columnar_dir(source_path), name + LOCK_SUFFIX))
+
+
+def _manifest_lock(directory):
+    # Held around every read-modify-write of the manifest, so entries written by other workers aren't lost
+    return file_lock(os.path.join(directory, MANIFEST_FILE + LOCK_SUFFIX))
+
+
+def _write_manifest(directory, manifest):
+    def write(temp_path):
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    write_atomic(os.path.join(directory, MANIFEST_FILE), write)
+
+
+def _table_file(name):
+    return os.path.splitext(name)[0] + TABLE_SUFFIX
+
+
+def _to_arrow(df, schema=None):
+    # pandas NaN would become Arrow nulls, and a numeric column with nulls can't be handed back to NumPy without a
+    # copy; float columns keep NaN as a plain value instead, so every numeric column loads as a view on the mapping
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type) and table.column(i).null_count:
+            values = df[field.name].to_numpy(dtype=field.type.to_pandas_dtype(), na_value=np.nan)
+            table = table.set_column(i, field, pa.array(values, type=field.type))
+    return table
+
+
+def write_table(table, path):
+    # Uncompressed Arrow IPC file, the format load_source memory-maps
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _write_arrow(df, path):
+    write_table(_to_arrow(df), path)
+
+
+def build_table(source_path):
+    name = os.path.basename(source_path)
+    if name not in CLEANERS:
+        raise ValueError(f"No ingest cleaner registered for {source_path}")
+    directory = _columnar_dir(source_path)
+    os.makedirs(directory, exist_ok=True)
+    table_file = _table_file(name)
+
+    df = _with_country_keys(name, _stringify_objects(CLEANERS[name](source_path)))
+    write_atomic(os.path.join(directory, table_file), lambda temp_path: _write_arrow(df, temp_path))
+
+    stat = os.stat(source_path)
+    with _manifest_lock(directory):
+        manifest = _read_manifest(directory)
+        previous = manifest.get(name, {}).get('table')
+        if previous and previous != table_file and os.path.exists(os.path.join(directory, previous)):
+            os.remove(os.path.join(directory, previous))
+        manifest[name] = {'sha256': file_hash(source_path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                          'table': table_file, 'version': INGEST_VERSION, 'countries': _countries_hash(name)}
+        _write_manifest(directory, manifest)
+    return df
+
+
+def source_entry(source_path):
+    # Manifest record of the source's columnar copy, or None if it has not been ingested
+    return _read_manifest(_columnar_dir(source_path)).get(os.path.basename(source_path))
+
+
+def append_table(source_path, csv_rows, base_stat):
+    # Extends the columnar copy of a CSV source that has just had csv_rows (CSV text without a header) appended to it.
+    # base_stat is the source's os.stat from before the append; the manifest keeps it, with the old row count, as the
+    # entry's 'base' so loaders holding that version can read just the new rows from the end of the table
+    with _source_lock(source_path):
+        _append_table(source_path, csv_rows, base_stat)
+
+
+def _append_table(source_path, csv_rows, base_stat):
+    name = os.path.basename(source_path)
+    directory = _columnar_dir(source_path)
+    table_file = os.path.join(directory, _table_file(name))
+    entry = source_entry(source_path)
+    if not entry or (entry['mtime_ns'], entry['size']) != (base_stat.st_mtime_ns, base_stat.st_size) or \
+            entry.get('countries') != _countries_hash(name):
+        # The columnar copy doesn't match the pre-append file or the current country keys; fall back to a full rebuild
+        build_table(source_path)
+        return
+    table = pa.ipc.open_file(pa.memory_map(table_file, 'r')).read_all()
+    # The CSV holds only the source columns; the country key columns are derived again for the new rows
+    source_columns = [column for column in table.schema.names if column not in (KEY_COLUMN, ISO3_COLUMN)]
+    try:
+        rows = pa_csv.read_csv(
+            pa.BufferReader(csv_rows.encode()),
+            read_options=pa_csv.ReadOptions(column_names=source_columns),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={column: table.schema.field(column).type for column in source_columns},
+                strings_can_be_null=True))
+        rows = _to_arrow(_with_country_keys(name, rows.to_pandas()), schema=table.schema)
+        # One record batch, like a fresh build, so each column still loads as a single zero-copy array
+        extended = pa.concat_tables([table, rows]).combine_chunks()
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        # New rows that don't fit the stored column types (e.g. text in a column that was all numbers)
+        build_table(source_path)
+        return
+
+    write_atomic(table_file, lambda temp_path: write_table(extended, temp_path))
+
+    stat = os.stat(source_path)
+    with _manifest_lock(directory):
+        manifest = _read_manifest(directory)
+        manifest[name] = {'sha256': file_hash(source_path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                          'table': _table_file(name), 'version': INGEST_VERSION, 'countries': _countries_hash(name),
+                          'base': {'mtime_ns': base_stat.st_mtime_ns, 'size': base_stat.st_size,
+                                   'rows': table.num_rows}}
+        _write_manifest(directory, manifest)
+
+
+def table_path(source_path):
+    # Path of an up-to-date columnar copy of the source, rebuilding it only when the source contents changed
+    with _source_lock(source_path):
+        return _fresh_table_path(source_path)
+
+
+def _fresh_table_path(source_path):
+    name = os.path.basename(source_path)
+    directory = _columnar_dir(source_path)
+    entry = _read_manifest(directory).get(name)
+    stat = os.stat(source_path)
+    table_file = os.path.join(directory, _table_file(name))
+
+    if entry and entry['table'] == _table_file(name) and entry.get('version') == INGEST_VERSION and \
+            entry.get('countries') == _countries_hash(name) and os.path.exists(table_file):
+        if (entry['mtime_ns'], entry['size']) == (stat.st_mtime_ns, stat.st_size):
+            return table_file
+        if entry['size'] == stat.st_size and entry['sha256'] == file_hash(source_path):
+            # Touched but unchanged: remember the new mtime so the hash isn't recomputed next time
+            with _manifest_lock(directory):
+                manifest = _read_manifest(directory)
+                manifest[name] = dict(entry, mtime_ns=stat.st_mtime_ns)
+                _write_manifest(directory, manifest)
+            return table_file
+
+    build_table(source_path)
+    return table_file
+
+
+def load_source(source_path):
+    # Columns stay backed by the memory-mapped file: numeric columns as read-only NumPy views, strings as Arrow arrays
+    table = pa.ipc.open_file(pa.memory_map(table_path(source_path), 'r')).read_all()
+    return _to_pandas(table)
+
+
+def load_source_tail(source_path, first_row):
+    # Rows from first_row on, e.g. the ones appended since a caller loaded the table; the Arrow table is sliced before
+    # conversion, so the cost follows the number of new rows rather than the table's history
+    table = pa.ipc.open_file(pa.memory_map(table_path(source_path), 'r')).read_all()
+    return _to_pandas(table.slice(first_row))
+
+
+def _to_pandas(table):
+    # copy=False keeps pandas from consolidating the views into new 2D blocks
+    return pd.DataFrame({name: _column(column) for name, column in zip(table.column_names, table.columns)},
+                        copy=False)
+
+
+def _column(column):
+    # Null-free numeric columns in one chunk (everything ingest writes) map straight to NumPy; anything else, e.g.
+    # booleans, which Arrow packs into bits, or dates, is converted with a copy
+    numeric = pa.types.is_integer(column.type) or pa.types.is_floating(column.type)
+    if numeric and column.num_chunks == 1 and column.null_count == 0:
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+    if column.type in (pa.string(), pa.large_string()):
+        return pd.arrays.ArrowExtensionArray(column)
+    return column.to_pandas()
+
+
+def build_all(data_dir='data'):
+    for name in CLEANERS:
+        source_path = os.path.join(data_dir, name)
+        if os.path.exists(source_path):
+            table_path(source_path)
+            print(f"{name} -> {os.path.join(_columnar_dir(source_path), _table_file(name))}")
+
+
+if __name__ == '__main__':
+    build_all(sys.argv[1] if len(sys.argv) > 1 else 'data')
@@ -1,52 +1,144 @@
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+from ingest import load_source
 
+TITLE = "Cumulative Investment Size by Region and Sector Over Time (in Millions)"
+COLORS = px.colors.qualitative.Alphabet
 
-def generate_cumulative_investment_chart(file_path):
-    sheet_4_df = pd.read_excel(file_path, sheet_name=3)
-    header_row_index = 4
-    data_start_row = header_row_index + 1
-    column_names = sheet_4_df.iloc[header_row_index]
-
-    df = pd.read_excel(file_path, sheet_name=3, skiprows=data_start_row, names=column_names)
-
-    month_to_num = {
-        'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6,
-        'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12
-    }
-    df['Month'] = df['Month'].map(month_to_num)
-    df['Date'] = pd.to_datetime(df[['Year', 'Month']].assign(DAY=1))
-    df['Quantity in Millions'] = pd.to_numeric(df['Quantity in Millions'], errors='coerce')
-
-    grouped_data = df.groupby(['Date', 'Region', 'Sector'], as_index=False)['Quantity in Millions'].sum()
-    grouped_data['Cumulative Investment'] = grouped_data.groupby(['Region', 'Sector'])['Quantity in Millions'].cumsum()
-
-    all_dates = pd.date_range(start=grouped_data['Date'].min(), end=grouped_data['Date'].max(), freq='MS')
-    all_combinations = pd.MultiIndex.from_product(
-        [grouped_data['Region'].unique(), grouped_data['Sector'].unique(), all_dates],
-        names=['Region', 'Sector', 'Date']
-    ).to_frame(index=False)
-
-    full_data = pd.merge(all_combinations, grouped_data, on=['Region', 'Sector', 'Date'], how='left')
-    full_data['Cumulative Investment'] = full_data.groupby(['Region', 'Sector'])[
-        'Cumulative Investment'].ffill().fillna(0)
-    full_data['Date_str'] = full_data['Date'].dt.strftime('%Y-%m')
-
-    pivot_data = full_data.pivot_table(index=['Date_str', 'Sector'], columns='Region', values='Cumulative Investment',
-                                       fill_value=0).reset_index()
-    plot_data = pd.melt(pivot_data, id_vars=['Date_str', 'Sector'], var_name='Region',
-                        value_name='Cumulative Investment')
-
-    fig = px.bar(
-        plot_data,
-        x='Region',
-        y='Cumulative Investment',
-        color='Sector',
-        animation_frame='Date_str',
-        title="Cumulative Investment Size by Region and Sector Over Time (in Millions)",
-        category_orders={"Date_str": sorted(plot_data['Date_str'].unique())},
-        color_discrete_sequence=px.colors.qualitative.Alphabet
+# Frame spacing for the windowed chart: the pandas period each frame closes, and how its slider step is labelled
+GRANULARITIES = {
+    'monthly': ('M', '%Y-%m'),
+    'quarterly': ('Q', '%Y-Q%q'),
+    'yearly': ('Y', '%Y'),
+}
+
+# Upper bound on frames per windowed figure, so the payload stays the same size however long the tracker history gets
+MAX_FRAMES = 60
+
+MONTH_TO_NUM = {
+    'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6,
+    'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12
+}
+
+
+def cumulative_investment_cube(df):
+    # Dense (month, region, sector) array of cumulative investment: every deal is scattered into its month once,
+    # then a single running sum over the time axis carries each region/sector total forward through empty months
+    month = df['Month'].map(MONTH_TO_NUM)
+    valid = month.notna() & df['Year'].notna() & df['Region'].notna() & df['Sector'].notna()
+    df = df[valid]
+    month_index = df['Year'].to_numpy(dtype=int) * 12 + month[valid].to_numpy(dtype=int) - 1
+    first_month = month_index.min()
+    region_codes, regions = pd.factorize(df['Region'].astype(str), sort=True)
+    sector_codes, sectors = pd.factorize(df['Sector'].astype(str), sort=True)
+
+    cube = np.zeros((month_index.max() - first_month + 1, len(regions), len(sectors)))
+    np.add.at(cube, (month_index - first_month, region_codes, sector_codes),
+              np.nan_to_num(df['Quantity in Millions'].to_numpy(dtype=float)))
+    np.cumsum(cube, axis=0, out=cube)
+
+    months = pd.date_range(start=pd.Timestamp(year=first_month // 12, month=first_month % 12 + 1, day=1),
+                           periods=len(cube), freq='MS')
+    return months, np.asarray(regions), np.asarray(sectors), cube
+
+
+def load_investment_cube(file_path):
+    return cumulative_investment_cube(load_source(file_path))
+
+
+def bar_traces(label, regions, sectors, values):
+    # One bar trace per sector for a single month; sectors sit side by side within each region
+    return [{
+        'type': 'bar',
+        'name': sector,
+        'x': regions,
+        'y': values[:, i],
+        'alignmentgroup': 'sectors',
+        'offsetgroup': sector,
+        'legendgroup': sector,
+        'marker': {'color': COLORS[i % len(COLORS)]},
+        'hovertemplate': f'Sector={sector}<br>Date={label}<br>Region=%{{x}}<br>'
+                         'Cumulative Investment=%{y}<extra></extra>',
+    } for i, sector in enumerate(sectors)]
+
+
+def animation_controls(labels, frame_duration=500):
+    # Play/pause buttons and a date slider stepping through the frames
+    def animate(duration):
+        return {'frame': {'duration': duration, 'redraw': True}, 'mode': 'immediate', 'fromcurrent': True,
+                'transition': {'duration': duration, 'easing': 'linear'}}
+
+    updatemenus = [{
+        'buttons': [
+            {'args': [None, animate(frame_duration)], 'label': '&#9654;', 'method': 'animate'},
+            {'args': [[None], animate(0)], 'label': '&#9724;', 'method': 'animate'},
+        ],
+        'direction': 'left', 'pad': {'r': 10, 't': 70}, 'showactive': False, 'type': 'buttons',
+        'x': 0.1, 'xanchor': 'right', 'y': 0, 'yanchor': 'top'
+    }]
+    sliders = [{
+        'active': 0,
+        'currentvalue': {'prefix': 'Date='},
+        'len': 0.9, 'pad': {'b': 10, 't': 60},
+        'steps': [{'args': [[label], animate(0)], 'label': label, 'method': 'animate'} for label in labels],
+        'x': 0.1, 'xanchor': 'left', 'y': 0, 'yanchor': 'top'
+    }]
+    return updatemenus, sliders
+
+
+def investment_figure(labels, regions, sectors, values, frame_duration=500, title=TITLE):
+    # values has one (region, sector) slice per label
+    regions = regions.tolist()
+    frames = [{'name': label, 'data': bar_traces(label, regions, sectors, values[i])} for i, label in enumerate(labels)]
+    updatemenus, sliders = animation_controls(labels, frame_duration)
+    fig = go.Figure(data=frames[0]['data'] if frames else [])
+    fig.update_layout(
+        title={'text': title},
+        barmode='relative',
+        legend={'title': {'text': 'Sector'}, 'tracegroupgap': 0},
+        xaxis={'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': 'Region'}},
+        yaxis={'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': 'Cumulative Investment (Millions)'},
+               'tickformat': ''},
+        updatemenus=updatemenus,
+        sliders=sliders
     )
-    fig.update_layout(yaxis_tickformat='')
-    fig.update_yaxes(title='Cumulative Investment (Millions)')
-    return fig
+    # Only the first frame and the layout go through plotly's validators; the frames follow the same trace schema and
+    # are attached as plain dicts, which dcc.Graph serializes as-is
+    return dict(fig.to_plotly_json(), frames=frames)
+
+
+def window_frames(months, start, end, granularity='monthly', max_frames=MAX_FRAMES):
+    # Cube rows to animate between start and end, one per period: the closing month of each. When the window has more
+    # than max_frames periods the spacing is coarsened (monthly to quarterly to yearly, then every few years) rather
+    # than skipping periods unevenly. Returns the rows, their labels and the spacing actually used
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}; expected one of {', '.join(GRANULARITIES)}")
+    window = np.flatnonzero((months >= pd.Timestamp(start)) & (months <= pd.Timestamp(end)))
+    coarser = list(GRANULARITIES)[list(GRANULARITIES).index(granularity):]
+    for spacing in coarser:
+        frequency, label_format = GRANULARITIES[spacing]
+        periods = months[window].to_period(frequency)
+        rows = window[np.append(periods[1:] != periods[:-1], True)] if len(window) else window
+        if len(rows) <= max_frames:
+            return rows, months[rows].to_period(frequency).strftime(label_format).tolist(), spacing
+    # Even yearly frames don't fit: keep every few years, counted back from the latest so it is always shown
+    step = -(-len(rows) // max_frames)
+    rows = rows[::-1][::step][::-1]
+    return rows, months[rows].to_period(frequency).strftime(label_format).tolist(), f"{step}-yearly"
+
+
+def windowed_investment_figure(months, regions, sectors, cube, start, end, granularity='monthly',
+                               max_frames=MAX_FRAMES):
+    rows, labels, spacing = window_frames(months, start, end, granularity, max_frames)
+    title = TITLE if spacing == granularity else \
+        f"{TITLE}<br><sup>{spacing.capitalize()} frames; {granularity} ones would be more than {max_frames}</sup>"
+    return investment_figure(labels, regions, sectors, cube[rows], title=title)
+
+
+def generate_cumulative_investment_chart(file_path):
+    # The full monthly animation as a go.Figure, for use outside the dashboard (show(), update_layout(), ...). Every
+    # frame goes through plotly's validators here, so the dashboard serves windowed_investment_figure instead
+    months, regions, sectors, cube = load_investment_cube(file_path)
+    return go.Figure(investment_figure(months.strftime('%Y-%m').tolist(), regions, sectors, cube))
@@ -1,68 +1,52 @@
-import pandas as pd
 import plotly.graph_objects as go
-import requests
 from base_map import MilitaryBasesMap
+from countries import ISO3_COLUMN, country_totals
+from geometry import load_countries_geojson
+from ingest import load_source
 
 
 class CombinedMap:
-    def __init__(self, dataset1_path=None, dataset2_path=None, combined_path=None, bases_path=None):
+    # Position of the military bases point trace, right after the choropleth, for callbacks that patch it
+    bases_trace = 1
+    # Choropleth layers the map can show, by value: investments, construction, or both together
+    layers = {
+        'investments': 'Investments',
+        'construction': 'Construction',
+        'combined': 'Combined Investments and Construction',
+    }
+
+    def __init__(self, dataset1_path=None, dataset2_path=None, combined_path=None, bases_path=None,
+                 simplify_tolerance=None):
         # Load investment datasets
-        self.df_dataset1 = pd.read_csv(dataset1_path or 'data/Investments.csv')
-        self.df_dataset2 = pd.read_csv(dataset2_path or 'data/Construction.csv')
-        self.df_combined = pd.read_csv(combined_path or 'data/Investments_and_construction.csv')
+        self.df_dataset1 = load_source(dataset1_path or 'data/Investments.csv')
+        self.df_dataset2 = load_source(dataset2_path or 'data/Construction.csv')
+        self.df_combined = load_source(combined_path or 'data/Investments_and_construction.csv')
 
         # Initialize and prepare military bases data
         self.military_map = MilitaryBasesMap(bases_path)
         self.military_map.assign_colors()
 
-        # Fetch GeoJSON data for countries
-        self.geojson = self.fetch_geojson()
-        self.change_json_id_to_name()
-
-    @staticmethod
-    def create_choropleth(df, title, geojson):
-        # Create a choropleth map for a given dataset
-        return go.Choroplethmapbox(
-            geojson=geojson,  # Use the GeoJSON data for countries how do I use name of the variable here?
-            ## use 'name' instead of 'id' in the GeoJSON features
-            locations=df['Country'],  # Make sure this matches the 'id' in your GeoJSON features
-            z=df['Quantity in Millions'],
-            colorscale='Reds',
-            marker_line_color='darkgray',
-            marker_line_width=0.5,
-            colorbar_title='Investment<br>Millions USD',
-            name=title,
-            showscale=True  # Show color scale
-        )
-
-    @staticmethod
-    def fetch_geojson():
-        url = "https://raw.githubusercontent.com/johan/world.geo.json/master/countries.geo.json"
-        response = requests.get(url)
-        return response.json()
-
-    def change_json_id_to_name(self):
-        special_countries = {
-            'USA': "USA",
-            "RUS": "Russian Federation",
-            'GBR': 'Britain',
-            'TZA': 'Tanzania',
-        }
-        # Change the 'id' field to 'name' in the GeoJSON
-        for feature in self.geojson['features']:
-            if feature['id'] not in special_countries:
-                feature['id'] = feature['properties']['name']
-            else:
-                feature['id'] = special_countries[feature['id']]
+        # Country geometry is loaded once per process, keyed by ISO3 code like the ingested tables
+        self.geojson = load_countries_geojson(simplify_tolerance)
 
     def preprocess_data(self):
-        self.summary_dataset1 = self.df_dataset1.groupby('Country')['Quantity in Millions'].sum().reset_index()
-        self.summary_dataset2 = self.df_dataset2.groupby('Country')['Quantity in Millions'].sum().reset_index()
-        self.summary_combined = self.df_combined.groupby('Country')['Quantity in Millions'].sum().reset_index()
-
-    import plotly.graph_objects as go
-
-
+        self.summary_dataset1 = country_totals(self.df_dataset1, 'Quantity in Millions')
+        self.summary_dataset2 = country_totals(self.df_dataset2, 'Quantity in Millions')
+        self.summary_combined = country_totals(self.df_combined, 'Quantity in Millions')
+
+    def layer_summary(self, layer):
+        return {'investments': self.summary_dataset1, 'construction': self.summary_dataset2,
+                'combined': self.summary_combined}[layer]
+
+    def layer_update(self, layer):
+        # Choropleth properties and title that point the single trace at one layer's summary
+        summary = self.layer_summary(layer)
+        title = self.layers[layer]
+        return {'locations': summary[ISO3_COLUMN].tolist(),
+                'z': summary['Quantity in Millions'].tolist(),
+                'text': summary['Country'].tolist(),
+                'zmax': float(summary['Quantity in Millions'].max()),
+                'name': title}, title + ' by Country'
 
     def create_map(self):
         fig = go.Figure()
@@ -74,100 +58,30 @@ class CombinedMap:
             [1.0, 'rgba(178, 10, 28, 0.6)']  # Red, less opaque
         ]
 
-        # Add choropleth layers without setting zmax here
-        traces = [
-            go.Choroplethmapbox(
-                geojson=self.geojson,
-                locations=self.summary_dataset1['Country'],
-                z=self.summary_dataset1['Quantity in Millions'],
-                colorscale=rd_bu_transparent,
-                zmin=0,
-                marker_line_color='black',
-                marker_line_width=0.2,
-                colorbar_title='Millions USD',
-                name='Investments',
-                colorbar=dict(
-                    title='Millions USD',
-                    x=1,  # Position the colorbar to the right of the map
-                    xanchor='left',
-                    titleside='right'
-                ),
-                visible=True  # Only the first dataset is visible initially
-            ),
-            go.Choroplethmapbox(
-                geojson=self.geojson,
-                locations=self.summary_dataset2['Country'],
-                z=self.summary_dataset2['Quantity in Millions'],
-                colorscale=rd_bu_transparent,
-                zmin=0,
-                marker_line_color='black',
-                marker_line_width=0.2,
-                name='Construction',
-                colorbar=dict(
-                    title='Millions USD',
-                    x=1,  # Position the colorbar to the right of the map
-                    xanchor='left',
-                    titleside='right'
-                ),
-                visible=False
-            ),
-            go.Choroplethmapbox(
-                geojson=self.geojson,
-                locations=self.summary_combined['Country'],
-                z=self.summary_combined['Quantity in Millions'],
-                colorscale=rd_bu_transparent,
-                zmin=0,
-                marker_line_color='black',
-                marker_line_width=0.2,
-                name='Combined Investment and Construction',
-                colorbar=dict(
-                    title='Millions USD',
-                    x=1,  # Position the colorbar to the right of the map
-                    xanchor='left',
-                    titleside='right'
-                ),
-                visible=False
+        # A single choropleth carries the geometry once; switching layers only swaps its locations and values
+        fig.add_trace(go.Choroplethmapbox(
+            geojson=self.geojson,
+            locations=self.summary_dataset1[ISO3_COLUMN],
+            z=self.summary_dataset1['Quantity in Millions'],
+            text=self.summary_dataset1['Country'],
+            zmax=self.summary_dataset1['Quantity in Millions'].max(),
+            colorscale=rd_bu_transparent,
+            zmin=0,
+            marker_line_color='black',
+            marker_line_width=0.2,
+            name='Investments',
+            colorbar=dict(
+                title='Millions USD',
+                x=1,  # Position the colorbar to the right of the map
+                xanchor='left',
+                titleside='right'
             )
-        ]
-
-        for trace in traces:
-            fig.add_trace(trace)
+        ))
 
-        # Add the military bases as scattermapbox traces
-        base_fig = self.military_map.create_map(update_layout=False)
-        for trace in base_fig.data:
-            trace.showlegend = True  # Enable legend for bases
-            fig.add_trace(trace)
+        # Add the military bases layer: one point trace plus its legend entries
+        fig.add_traces(self.military_map.traces(zoom=3))
 
-        # Setup toggle buttons for interactivity
         fig.update_layout(
-            updatemenus=[
-                {
-                    'buttons': [
-                        {'label': 'Investments',
-                         'method': 'update',
-                         'args': [{'visible': [True, False, False] + [True] * len(base_fig.data)},
-                                  {'title': 'Investments by Country',
-                                   'mapbox.zmax': self.summary_dataset1['Quantity in Millions'].max()}]},
-                        {'label': 'Construction',
-                         'method': 'update',
-                         'args': [{'visible': [False, True, False] + [True] * len(base_fig.data)},
-                                  {'title': 'Construction by Country',
-                                   'mapbox.zmax': self.summary_dataset2['Quantity in Millions'].max()}]},
-                        {'label': 'Combined',
-                         'method': 'update',
-                         'args': [{'visible': [False, False, True] + [True] * len(base_fig.data)},
-                                  {'title': 'Combined Investments and Construction by Country',
-                                   'mapbox.zmax': self.summary_combined['Quantity in Millions'].max()}]}
-                    ],
-                    'direction': 'down',
-                    'showactive': True,
-                    'x': 0.1,
-                    'xanchor': 'left',
-                    'y': 1.25,  # Adjust y position to prevent overlap with title
-                    'yanchor': 'top'
-                }
-            ],
             mapbox_style="dark",
             mapbox_accesstoken=self.military_map.mapbox_access_token,
             mapbox_zoom=3,
@@ -0,0 +1,40 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PageRegistry:
+    def __init__(self):
+        self._layouts = {}
+        self._warm_ups = []
+        self._warm_up_started = False
+        self._lock = threading.Lock()
+
+    def route(self, pathname, warm_up=None):
+        # Registers a page's layout function; nothing is loaded until the page is rendered or warmed up
+        def register(layout):
+            self._layouts[pathname] = layout
+            if warm_up is not None:
+                self._warm_ups.append(warm_up)
+            return layout
+        return register
+
+    def render(self, pathname, default):
+        return self._layouts.get(pathname, default)()
+
+    def start_warm_up(self):
+        # Runs every page's data/figure factory once on a daemon thread; safe to call on every request
+        with self._lock:
+            if self._warm_up_started:
+                return
+            self._warm_up_started = True
+        threading.Thread(target=self._warm_up, name='page-warm-up', daemon=True).start()
+
+    def _warm_up(self):
+        for warm_up in self._warm_ups:
+            try:
+                warm_up()
+            except Exception:
+                # A page that fails here will raise again, visibly, when it is first rendered
+                logger.exception("Warm-up of %s failed", getattr(warm_up, '__name__', warm_up))
@@ -0,0 +1,208 @@
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+from alliance_map import AllianceMap
+from cache import file_signature
+from countries import ISO3_COLUMN, KEY_COLUMN, country_dimension, dimension_hash
+from ingest import COLUMNAR_DIR, INGEST_VERSION, LOCK_SUFFIX, file_lock, load_source, write_atomic, write_table
+
+# Sources of the country-year panel, all joined on the country dimension's integer key
+PANEL_SOURCES = {
+    'investment': 'data/Investments_and_construction.csv',
+    'gdp': 'data/API_NY.GDP.MKTP.CD_DS2_en_csv_v2_240389.csv',
+    'military_expenditure': 'data/SIPRI-Milex-data-1992-2023.xlsx',
+    'alliances': 'data/US_China_Alliances_Partnerships.csv',
+}
+
+PANEL_FILE = 'dime_panel.arrow'
+
+
+# Every panel column with its axis label; money is in current US$ millions throughout
+METRICS = {
+    'investment': 'Chinese investment and construction (US$ millions)',
+    'gdp': 'GDP (US$ millions)',
+    'military_expenditure': 'Military expenditure (US$ millions)',
+    'investment_share_gdp': 'Chinese investment and construction (share of GDP)',
+    'military_expenditure_share_gdp': 'Military expenditure (share of GDP)',
+    'alignment': 'Alignment (0 US, 0.5 both, 1 China)',
+}
+
+
+class DimePanel:
+    def __init__(self, years, values):
+        # values maps each metric to a dense (country key, year) array, so a cross-domain view at any year is a column
+        # of two of them
+        self.dimension = country_dimension()
+        self.years = np.asarray(years)
+        self.values = values
+
+    @classmethod
+    def build(cls, sources=PANEL_SOURCES):
+        n_countries = len(country_dimension().table)
+        investments = load_source(sources['investment'])
+        gdp = load_source(sources['gdp'])
+        military = load_source(sources['military_expenditure'])
+        relations = load_source(sources['alliances'])
+
+        gdp_columns = [column for column in gdp.columns if column.isdigit()]
+        first_year = min(int(gdp_columns[0]), int(investments['Year'].min()), int(military['Year'].min()))
+        last_year = max(int(gdp_columns[-1]), int(investments['Year'].max()), int(military['Year'].max()))
+        years = np.arange(first_year, last_year + 1)
+
+        def scatter(keys, years_of_rows, values, accumulate=False):
+            # Dense (country, year) array from long-form rows; rows without a known country or a value are dropped.
+            # Accumulated sums start from zero across the years the source covers, so a year without deals reads 0
+            panel = np.full((n_countries, len(years)), np.nan)
+            known = (keys >= 0) & np.isfinite(values)
+            rows = keys[known], years_of_rows[known].astype(int) - first_year
+            if accumulate:
+                panel[:, int(years_of_rows.min()) - first_year:int(years_of_rows.max()) - first_year + 1] = 0
+                np.add.at(panel, rows, values[known])
+            else:
+                panel[rows] = values[known]
+            return panel
+
+        investment = scatter(investments[KEY_COLUMN].to_numpy(), investments['Year'].to_numpy(dtype=float),
+                             investments['Quantity in Millions'].to_numpy(dtype=float, na_value=np.nan),
+                             accumulate=True)
+
+        economies = gdp[gdp[KEY_COLUMN].to_numpy() >= 0]
+        gdp_panel = np.full((n_countries, len(years)), np.nan)
+        gdp_panel[np.ix_(economies[KEY_COLUMN].to_numpy(), np.array(gdp_columns, dtype=int) - first_year)] = \
+            economies[gdp_columns].to_numpy(dtype=float, na_value=np.nan) / 1e6
+
+        military_expenditure = scatter(military[KEY_COLUMN].to_numpy(), military['Year'].to_numpy(dtype=float),
+                                       military['USD'].to_numpy(dtype=float, na_value=np.nan))
+
+        partners = relations[relations[KEY_COLUMN].to_numpy() >= 0]
+        alignment = AllianceMap.alignment(partners, partners[KEY_COLUMN].to_numpy(), n_countries, years)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            positive_gdp = np.where(gdp_panel > 0, gdp_panel, np.nan)
+            values = {
+                'investment': investment,
+                'gdp': gdp_panel,
+                'military_expenditure': military_expenditure,
+                'investment_share_gdp': investment / positive_gdp,
+                'military_expenditure_share_gdp': military_expenditure / positive_gdp,
+                'alignment': alignment,
+            }
+        return cls(years, values)
+
+    def to_table(self, metadata=None):
+        # Long form, country-major then year, so each metric column reshapes straight back into its array
+        n_countries, n_years = len(self.dimension.table), len(self.years)
+        keys = np.repeat(np.arange(n_countries), n_years)
+        columns = {
+            KEY_COLUMN: keys,
+            ISO3_COLUMN: self.dimension.iso3_codes[keys],
+            'Country': self.dimension.names[keys],
+            'Year': np.tile(self.years, n_countries),
+        }
+        columns.update({metric: self.values[metric].ravel() for metric in METRICS})
+        table = pa.table(columns)
+        return table.replace_schema_metadata(metadata) if metadata else table
+
+    @classmethod
+    def from_table(cls, table):
+        years = np.unique(table.column('Year').to_numpy())
+        shape = (table.num_rows // len(years), len(years))
+        return cls(years, {metric: table.column(metric).to_numpy().reshape(shape) for metric in METRICS})
+
+    def year_column(self, year):
+        # Panel column for a year, clamped to the years covered
+        return int(np.clip(np.searchsorted(self.years, year), 0, len(self.years) - 1))
+
+    def cross_section(self, metrics, year):
+        # Countries with a value for every metric in that year, and those values
+        column = self.year_column(year)
+        values = [self.values[metric][:, column] for metric in metrics]
+        keys = np.flatnonzero(np.logical_and.reduce([np.isfinite(value) for value in values]))
+        return keys, [value[keys] for value in values]
+
+    def data_years(self, metric):
+        # First and last year in which any country has a value
+        years = self.years[np.isfinite(self.values[metric]).any(axis=0)]
+        return int(years[0]), int(years[-1])
+
+
+# Marker colors by alignment, matching the alliance map; countries with neither partner are drawn grey
+ALIGNMENT_COLORSCALE = [[0, 'blue'], [0.5, 'purple'], [1, 'red']]
+
+
+def cross_section_figure(panel, x_metric, y_metric, year, scale='linear'):
+    # Scatter of every country with both metrics in that year, built from two panel columns without touching a source
+    keys, (x, y, alignment) = panel.cross_section([x_metric, y_metric, 'alignment'], year)
+    all_keys, (all_x, all_y) = panel.cross_section([x_metric, y_metric], year)
+    unaligned = np.isin(all_keys, keys, invert=True)
+    hovertemplate = f"%{{text}}<br>{METRICS[x_metric]}=%{{x}}<br>{METRICS[y_metric]}=%{{y}}<extra></extra>"
+    year = int(panel.years[panel.year_column(year)])
+    return {
+        'data': [{
+            'type': 'scatter',
+            'mode': 'markers',
+            'name': 'US / China partner',
+            'x': x,
+            'y': y,
+            'text': panel.dimension.names[keys],
+            'marker': {'color': alignment, 'colorscale': ALIGNMENT_COLORSCALE, 'cmin': 0, 'cmax': 1, 'size': 10},
+            'hovertemplate': hovertemplate
+        }, {
+            'type': 'scatter',
+            'mode': 'markers',
+            'name': 'Neither',
+            'x': all_x[unaligned],
+            'y': all_y[unaligned],
+            'text': panel.dimension.names[all_keys[unaligned]],
+            'marker': {'color': 'grey', 'size': 8},
+            'hovertemplate': hovertemplate
+        }],
+        'layout': {
+            'title': {'text': f"{METRICS[y_metric]} vs. {METRICS[x_metric]}, {year}"},
+            'xaxis': {'title': {'text': METRICS[x_metric]}, 'type': scale},
+            'yaxis': {'title': {'text': METRICS[y_metric]}, 'type': scale},
+            'uirevision': f"{x_metric}/{y_metric}/{scale}"
+        }
+    }
+
+
+def panel_path(sources=PANEL_SOURCES):
+    return os.path.join(os.path.dirname(sources['investment']) or '.', COLUMNAR_DIR, PANEL_FILE)
+
+
+def _panel_signature(sources):
+    # Source files and country dimension the panel was built from; any change to them rebuilds it
+    return json.dumps({'version': INGEST_VERSION, 'countries': dimension_hash(),
+                       'sources': file_signature(*sources.values())})
+
+
+def load_panel(sources=PANEL_SOURCES):
+    # The materialized panel, memory-mapped, or a fresh build written in its place when a source has changed. Threads
+    # and worker processes asking at the same time wait for one build instead of racing on the file
+    with file_lock(os.path.splitext(panel_path(sources))[0] + LOCK_SUFFIX):
+        return _load_or_build(sources)
+
+
+def _load_or_build(sources):
+    path = panel_path(sources)
+    signature = _panel_signature(sources)
+    try:
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        if (table.schema.metadata or {}).get(b'sources', b'').decode() == signature:
+            return DimePanel.from_table(table)
+    except (OSError, pa.ArrowInvalid):
+        pass
+
+    panel = DimePanel.build(sources)
+    table = panel.to_table({'sources': signature})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, lambda temp_path: write_table(table, temp_path))
+    return panel
+
+
+if __name__ == '__main__':
+    panel = load_panel()
+    print(f"{panel_path()}: {len(panel.dimension.table)} countries x {len(panel.years)} years "
+          f"({panel.years[0]}-{panel.years[-1]})")
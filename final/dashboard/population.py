@@ -1,17 +1,23 @@
+from concurrent.futures import ProcessPoolExecutor
+
 # Import Dash libraries
 from dash import Dash, dcc, html, Input, Output
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
+from cache import LRUCache
+from ingest import load_source
+
+# Five-year age bands of the demographics table, youngest first
+AGE_GROUPS = [f'{i}-{i + 4}' for i in range(0, 100, 5)] + ['100+']
 
 
 class SouthKoreaDemographicsApp:
     def __init__(self, title=None, debug=True, port=8050, host='127.0.0.1',
                  df_admin=None, df_demographics=None, projection_years=50, initial_birth_rate=0.7,
-                 initial_projection_year=20, initial_mortality_rate=1.0):
-        self.df_admin = pd.read_csv(df_admin or 'data/Population__Households_and_Housing_Units_20240508191732.csv',
-                                    skiprows=[0])
-        self.df_demographics = pd.read_csv(df_demographics or 'data/demographics.csv')
+                 initial_projection_year=20, initial_mortality_rate=1.0, projection_cache_size=64):
+        self.df_admin = load_source(df_admin or 'data/Population__Households_and_Housing_Units_20240508191732.csv')
+        self.df_demographics = load_source(df_demographics or 'data/demographics.csv')
         self.projection_years = projection_years
         self.initial_birth_rate = initial_birth_rate
         self.initial_projection_year = initial_projection_year
@@ -79,6 +85,11 @@ class SouthKoreaDemographicsApp:
                 **{i: 100 for i in range(100, 105)}  # Centenarians
             }.items()
         }
+        self.mortality_vector = np.array([self.default_mortality_rates[age] for age in range(105)])
+
+        # The baseline never changes; projections are kept per slider scenario so moving the year only re-slices
+        self.initial_population = self.extract_initial_age_data_by_year(self.df_demographics)
+        self.projection_cache = LRUCache(max_size=projection_cache_size)
 
         # Initialize the Dash app
         self.app = Dash(__name__)
@@ -133,102 +144,106 @@ class SouthKoreaDemographicsApp:
 
     @staticmethod
     def extract_initial_age_data_by_year(df):
-        initial_data = {}
-
-        age_ranges = {
-            '0-4': range(0, 5),
-            '5-9': range(5, 10),
-            '10-14': range(10, 15),
-            '15-19': range(15, 20),
-            '20-24': range(20, 25),
-            '25-29': range(25, 30),
-            '30-34': range(30, 35),
-            '35-39': range(35, 40),
-            '40-44': range(40, 45),
-            '45-49': range(45, 50),
-            '50-54': range(50, 55),
-            '55-59': range(55, 60),
-            '60-64': range(60, 65),
-            '65-69': range(65, 70),
-            '70-74': range(70, 75),
-            '75-79': range(75, 80),
-            '80-84': range(80, 85),
-            '85-89': range(85, 90),
-            '90-94': range(90, 95),
-            '95-99': range(95, 100),
-            '100+': range(100, 105)
-        }
-
-        for age_range, years in age_ranges.items():
-            male_count = df.loc[df['AgeGroup'] == age_range, 'Male'].values[0]
-            female_count = df.loc[df['AgeGroup'] == age_range, 'Female'].values[0]
-
-            per_year_male = male_count / len(years)
-            per_year_female = female_count / len(years)
-
-            for year in years:
-                initial_data[f'Male_{year}'] = per_year_male
-                initial_data[f'Female_{year}'] = per_year_female
-
-        return initial_data
+        # Spread each five-year group evenly over its single years: rows are (male, female), columns ages 0-104
+        counts = df.set_index('AgeGroup').loc[AGE_GROUPS, ['Male', 'Female']].to_numpy(dtype=float).T
+        return np.repeat(counts / 5, 5, axis=1)
 
     def compute_dynamic_asf_rs(self, tfr):
         return {age: tfr * pct / 5 for age, pct in self.base_asfr_percentages.items()}
 
     @staticmethod
-    def project_population_by_year(initial_data, asfrs, mortality_rates, migration_adj, years, mortality_factor):
-        projected_data = {k: [v] for k, v in initial_data.items()}
+    def fertility_by_age(asfrs):
+        fertility = np.zeros(105)
+        for age_range, rate in asfrs.items():
+            start, end = map(int, age_range.split('_'))
+            fertility[start:end + 1] = rate
+        return fertility
 
-        for year in range(1, years):
-            # Age people by 1 year and apply mortality
-            for age in range(104, -1, -1):
-                male_key = f'Male_{age}'
-                female_key = f'Female_{age}'
-
-                if age == 0:
-                    continue
+    @staticmethod
+    def project_population_by_year(initial_population, fertility, mortality_rates, migration_adj, years,
+                                   mortality_factor):
+        # Population held as (sex, age, year); each step ages everyone by one year and adds births at age 0
+        survival = (1 - np.asarray(mortality_rates) * mortality_factor) * (1 + migration_adj / 100)
+        half_fertility = np.asarray(fertility) / 2
+        # Filled year-major so every step writes one contiguous block
+        projected = np.empty((years, 2, 105))
+        projected[0] = initial_population
 
-                # Apply migration and adjusted mortality rates
-                projected_data[male_key].append(
-                    projected_data[f'Male_{age - 1}'][year - 1] * (1 - mortality_rates[age] * mortality_factor) * (1 + migration_adj / 100)
-                )
-                projected_data[female_key].append(
-                    projected_data[f'Female_{age - 1}'][year - 1] * (1 - mortality_rates[age] * mortality_factor) * (1 + migration_adj / 100)
-                )
+        for year in range(1, years):
+            previous = projected[year - 1]
+            current = projected[year]
+            np.multiply(previous[:, :-1], survival[1:], out=current[:, 1:])
+            current[:, 0] = previous[1].dot(half_fertility)
 
-            # Calculate new births using ASFRs for ages 15-49
-            new_births = sum(
-                projected_data[f'Female_{age}'][year - 1] * asfrs.get(f'{age // 5 * 5}_{age // 5 * 5 + 4}', 0)
-                for age in range(15, 50)
-            )
+        return projected.transpose(1, 2, 0)
 
-            projected_data['Male_0'].append(new_births / 2)
-            projected_data['Female_0'].append(new_births / 2)
+    @staticmethod
+    def project_scenarios(initial_population, unit_fertility, mortality_rates, tfr, migration_adj, mortality_factor,
+                          years):
+        # Same steps as project_population_by_year, broadcast over a leading scenario axis. Only the current year is
+        # kept in memory; each year is reduced straight to five-year groups
+        tfr = np.asarray(tfr, dtype=float)
+        migration_adj = np.asarray(migration_adj, dtype=float)
+        mortality_factor = np.asarray(mortality_factor, dtype=float)
+        scenarios = len(tfr)
+        survival = (1 - mortality_factor[:, None] * np.asarray(mortality_rates)) * (1 + migration_adj[:, None] / 100)
+        half_fertility = tfr[:, None] * np.asarray(unit_fertility) / 2
+        state = np.repeat(np.asarray(initial_population, dtype=float)[None], scenarios, axis=0)
+
+        pyramids = np.empty((scenarios, years, 2, 21))
+        for year in range(years):
+            if year:
+                births = np.einsum('sa,sa->s', state[:, 1], half_fertility)
+                state[:, :, 1:] = state[:, :, :-1] * survival[:, None, 1:]
+                state[:, :, 0] = births[:, None]
+            pyramids[:, year] = state.reshape(scenarios, 2, 21, 5).sum(axis=3)
+        return pyramids.sum(axis=(2, 3)), pyramids
 
-        return projected_data
+    @staticmethod
+    def scenario_grid(tfr_values, migration_values, mortality_values):
+        return pd.MultiIndex.from_product([tfr_values, migration_values, mortality_values],
+                                          names=['tfr', 'migration_adj', 'mortality_factor']).to_frame(index=False)
+
+    def run_scenarios(self, scenarios, years=None, chunk_size=1000, processes=None):
+        # One row per (scenario, year) with the total population and the male/female five-year age groups
+        scenarios = pd.DataFrame(scenarios, columns=['tfr', 'migration_adj', 'mortality_factor']).astype(float)
+        years = years or self.projection_years
+        unit_fertility = self.fertility_by_age(self.compute_dynamic_asf_rs(1.0))
+        chunks = [scenarios.iloc[start:start + chunk_size] for start in range(0, len(scenarios), chunk_size)]
+        arguments = [(self.initial_population, unit_fertility, self.mortality_vector, chunk['tfr'].to_numpy(),
+                      chunk['migration_adj'].to_numpy(), chunk['mortality_factor'].to_numpy(), years)
+                     for chunk in chunks]
+
+        if processes:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(self.project_scenarios, *zip(*arguments)))
+        else:
+            results = [self.project_scenarios(*args) for args in arguments]
+        totals = np.concatenate([result[0] for result in results])
+        pyramids = np.concatenate([result[1] for result in results])
+
+        sweep = scenarios.loc[scenarios.index.repeat(years)].reset_index(names='scenario')
+        sweep['year'] = np.tile(2024 + np.arange(years), len(scenarios))
+        sweep['total_population'] = totals.ravel()
+        groups = pd.DataFrame(pyramids.reshape(len(sweep), 2 * len(AGE_GROUPS)),
+                              columns=[f'{sex}_{group}' for sex in ('Male', 'Female') for group in AGE_GROUPS])
+        return pd.concat([sweep, groups], axis=1)
 
     @staticmethod
     def create_population_pyramid(projected_data, projection_year):
-        age_groups = [f'{i}-{i + 4}' for i in range(0, 100, 5)] + ['100+']
-        male_values = [
-                          -sum(projected_data[f'Male_{age}'][projection_year] for age in range(start, start + 5))
-                          for start in range(0, 100, 5)
-                      ] + [-sum(projected_data[f'Male_{age}'][projection_year] for age in range(100, 105))]
-        female_values = [
-                            sum(projected_data[f'Female_{age}'][projection_year] for age in range(start, start + 5))
-                            for start in range(0, 100, 5)
-                        ] + [sum(projected_data[f'Female_{age}'][projection_year] for age in range(100, 105))]
+        male_values, female_values = projected_data[:, :, projection_year].reshape(2, len(AGE_GROUPS), 5).sum(axis=2)
+        male_values = -male_values
 
         pyramid_fig = go.Figure()
         pyramid_fig.add_trace(go.Bar(
-            y=age_groups,
+            y=AGE_GROUPS,
             x=male_values,
             name='Male',
             orientation='h',
             marker=dict(color='blue')
         ))
         pyramid_fig.add_trace(go.Bar(
-            y=age_groups,
+            y=AGE_GROUPS,
             x=female_values,
             name='Female',
             orientation='h',
@@ -245,28 +260,27 @@ class SouthKoreaDemographicsApp:
 
         return pyramid_fig
 
-    def update_graphs(self, tfr, migration_adj, projection_year, mortality_factor):
-        # Prepare initial demographic data
-        initial_age_data = self.extract_initial_age_data_by_year(self.df_demographics)
-
-        # Dynamically compute ASFRs based on TFR
-        asfrs = self.compute_dynamic_asf_rs(tfr)
+    def projection(self, tfr, migration_adj, mortality_factor):
+        key = (round(tfr, 6), round(migration_adj, 6), round(mortality_factor, 6))
+        return self.projection_cache.get_or_build(key, lambda: self.project_population_by_year(
+            self.initial_population, self.fertility_by_age(self.compute_dynamic_asf_rs(tfr)), self.mortality_vector,
+            migration_adj, self.projection_years, mortality_factor
+        ))
 
-        # Project population and households over time
-        projected_age_groups = self.project_population_by_year(
-            initial_age_data, asfrs, self.default_mortality_rates, migration_adj, self.projection_years, mortality_factor
-        )
+    def update_graphs(self, tfr, migration_adj, projection_year, mortality_factor):
+        projected_age_groups = self.projection(tfr, migration_adj, mortality_factor)
 
         # Create population projection graph
         population_years = [2024 + i for i in range(self.projection_years)]
         population_fig = go.Figure()
         population_fig.add_trace(go.Scatter(
             x=population_years,
-            y=[sum(projected_age_groups[f'Male_{age}'][year] + projected_age_groups[f'Female_{age}'][year] for age in range(0, 105)) for year in range(self.projection_years)],
+            y=projected_age_groups.sum(axis=(0, 1)),
             mode='lines+markers',
             name='Projected Population'
         ))
-        population_fig.update_layout(title='Projected Population Over Time', xaxis_title='Year', yaxis_title='Population')
+        population_fig.update_layout(title='Projected Population Over Time', xaxis_title='Year',
+                                     yaxis_title='Population')
 
         # Create population pyramid
         demographic_fig = self.create_population_pyramid(projected_age_groups, projection_year)
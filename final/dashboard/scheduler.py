@@ -0,0 +1,41 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FigureScheduler:
+    def __init__(self, figure_cache, interval=60):
+        self.figure_cache = figure_cache
+        self.interval = interval
+        self.jobs = []
+        self._started = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def add(self, route, source_paths, builder):
+        self.jobs.append((route, source_paths, builder))
+
+    def start(self):
+        # Builds every job right away, then rebuilds whichever ones' source files change; safe to call repeatedly
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name='figure-scheduler', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_pending(self):
+        for route, source_paths, builder in self.jobs:
+            try:
+                self.figure_cache.refresh(route, source_paths, builder)
+            except Exception:
+                # Keep serving the last published figure; the next pass will try again
+                logger.exception("Rebuilding %s failed", route)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(self.interval)
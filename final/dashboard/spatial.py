@@ -0,0 +1,135 @@
+import numpy as np
+
+WORLD = (-180.0, -90.0, 180.0, 90.0)
+
+
+class GridIndex:
+    def __init__(self, lon, lat, cell_size=1.0):
+        # Points are bucketed into fixed lon/lat cells and kept sorted by cell, so a viewport query is a handful of
+        # binary searches over the cells it overlaps plus an exact filter on the edge cells
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.cell_size = cell_size
+        self.columns = int(np.ceil(360 / cell_size))
+        self.rows = int(np.ceil(180 / cell_size))
+        valid = np.flatnonzero(np.isfinite(self.lon) & np.isfinite(self.lat))
+        cells = self._cell(self.lon[valid], self.lat[valid])
+        order = np.argsort(cells, kind='stable')
+        self.order = valid[order]
+        self.cells = cells[order]
+
+    def _column(self, lon):
+        return np.clip(np.floor((np.asarray(lon) + 180) / self.cell_size).astype(int), 0, self.columns - 1)
+
+    def _row(self, lat):
+        return np.clip(np.floor((np.asarray(lat) + 90) / self.cell_size).astype(int), 0, self.rows - 1)
+
+    def _cell(self, lon, lat):
+        return self._row(lat) * self.columns + self._column(lon)
+
+    def query(self, west, south, east, north):
+        # Indices of the points inside the box, in their original order. West > east means the box crosses the
+        # antimeridian
+        rows = np.arange(self._row(south), self._row(north) + 1)
+        if west <= east:
+            column_ranges = [(self._column(west), self._column(east))]
+        elif self._column(west) <= self._column(east):
+            # Both edges in one column (a view just under 360 degrees wide): the two ranges would overlap and return
+            # that column's points twice, so scan every column once and leave it to the exact filter
+            column_ranges = [(0, self.columns - 1)]
+        else:
+            column_ranges = [(self._column(west), self.columns - 1), (0, self._column(east))]
+        candidates = []
+        for first, last in column_ranges:
+            starts = np.searchsorted(self.cells, rows * self.columns + first, side='left')
+            ends = np.searchsorted(self.cells, rows * self.columns + last, side='right')
+            candidates.extend(self.order[start:end] for start, end in zip(starts, ends) if end > start)
+        if not candidates:
+            return np.empty(0, dtype=int)
+        indices = np.concatenate(candidates)
+        lon, lat = self.lon[indices], self.lat[indices]
+        in_lon = (lon >= west) & (lon <= east) if west <= east else (lon >= west) | (lon <= east)
+        return np.sort(indices[in_lon & (lat >= south) & (lat <= north)])
+
+
+class PointLayer:
+    def __init__(self, lon, lat, color, hovertext, size=9, label='points', cell_size=1.0, max_points=1000):
+        # A map point layer served a viewport at a time; once a view would hold more than max_points points they are
+        # merged into zoom-sized clusters, so a response stays bounded however large the layer grows
+        self.index = GridIndex(lon, lat, cell_size)
+        self.color = np.asarray(color, dtype=object)
+        self.hovertext = np.asarray(hovertext, dtype=object)
+        self.size = size
+        self.label = label
+        self.max_points = max_points
+        self.colors, self.color_codes = np.unique(self.color.astype(str), return_inverse=True)
+
+    def view(self, bounds=WORLD, zoom=0):
+        indices = self.index.query(*bounds)
+        if len(indices) <= self.max_points:
+            return {
+                'lat': self.index.lat[indices],
+                'lon': self.index.lon[indices],
+                'color': self.color[indices],
+                'hovertext': self.hovertext[indices],
+                'size': self.size
+            }
+        return self.clusters(indices, zoom)
+
+    def clusters(self, indices, zoom):
+        # Cells about 64 pixels across at this zoom; each cluster sits at its points' mean position,
+        # takes their most common color and grows with the log of its count
+        cell_size = 360 / 2 ** (max(zoom, 0) + 3)
+        lon, lat = self.index.lon[indices], self.index.lat[indices]
+        cells = (np.floor((lat + 90) / cell_size) * np.ceil(360 / cell_size) +
+                 np.floor((lon + 180) / cell_size)).astype(np.int64)
+        cluster_ids, cluster_of = np.unique(cells, return_inverse=True)
+        counts = np.bincount(cluster_of)
+        mean_lon = np.bincount(cluster_of, weights=lon) / counts
+        mean_lat = np.bincount(cluster_of, weights=lat) / counts
+
+        color_counts = np.zeros((len(cluster_ids), len(self.colors)), dtype=int)
+        np.add.at(color_counts, (cluster_of, self.color_codes[indices]), 1)
+        colors = self.colors[color_counts.argmax(axis=1)]
+
+        # A cluster of one keeps its point's own hover text
+        first = np.empty(len(cluster_ids), dtype=int)
+        first[cluster_of[::-1]] = indices[::-1]
+        hovertext = np.where(counts == 1, self.hovertext[first],
+                             np.array([f"{count} {self.label}" for count in counts], dtype=object))
+        return {
+            'lat': mean_lat,
+            'lon': mean_lon,
+            'color': colors,
+            'hovertext': hovertext,
+            'size': self.size + 3 * np.log2(counts)
+        }
+
+
+def viewport(relayout_data, width=1200, height=800):
+    # (west, south, east, north) and zoom of a mapbox subplot from a relayoutData event, or None if the event didn't
+    # move the map. Uses the corner coordinates plotly reports when present; otherwise estimates the box from the
+    # center and zoom for a width x height pixel map
+    if not relayout_data or 'mapbox.zoom' not in relayout_data:
+        return None
+    zoom = relayout_data['mapbox.zoom']
+    derived = relayout_data.get('mapbox._derived') or {}
+    corners = derived.get('coordinates')
+    if corners:
+        lons = [corner[0] for corner in corners]
+        lats = [corner[1] for corner in corners]
+        west, east, south, north = min(lons), max(lons), min(lats), max(lats)
+    else:
+        center = relayout_data.get('mapbox.center') or {'lon': 0, 'lat': 0}
+        half_width = 180 * width / (512 * 2 ** zoom)
+        half_height = half_width * height / width
+        west, east = center['lon'] - half_width, center['lon'] + half_width
+        south, north = center['lat'] - half_height, center['lat'] + half_height
+    south, north = max(south, -90.0), min(north, 90.0)
+    if east - west >= 360:
+        return (-180.0, south, 180.0, north), zoom
+    return (_wrap(west), south, _wrap(east), north), zoom
+
+
+def _wrap(lon):
+    return (lon + 180) % 360 - 180
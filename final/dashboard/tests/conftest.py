@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# The dashboard modules import each other as top-level modules and read data/ relative to the working directory
+DASHBOARD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DASHBOARD_DIR)
+
+
+@pytest.fixture(autouse=True)
+def dashboard_dir(monkeypatch):
+    monkeypatch.chdir(DASHBOARD_DIR)
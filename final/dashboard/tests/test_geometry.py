@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from countries import KEY_COLUMN, country_dimension
+from geometry import assign_dimension_ids, load_countries_geojson
+from ingest import load_source
+
+# Small island and city states drawn as points on the source maps; the 1:110m outlines have no polygon for them
+NO_OUTLINE = {'ATG', 'BHR', 'BRB', 'CPV', 'MDV', 'MLT', 'MUS', 'SGP', 'STP', 'WSM'}
+
+MAP_SOURCES = [
+    'data/Investments.csv',
+    'data/Construction.csv',
+    'data/Investments_and_construction.csv',
+    'data/US_China_Alliances_Partnerships.csv',
+]
+
+
+@pytest.mark.parametrize('source', MAP_SOURCES)
+def test_every_mapped_country_has_an_outline(source):
+    dimension = country_dimension()
+    feature_ids = {feature['id'] for feature in load_countries_geojson()['features']}
+    keys = load_source(source)[KEY_COLUMN].to_numpy()
+    codes = set(dimension.iso3_codes[np.unique(keys[keys >= 0])])
+    assert sorted(codes - feature_ids - NO_OUTLINE) == []
+
+
+def test_feature_ids_are_unique():
+    feature_ids = [feature['id'] for feature in load_countries_geojson()['features']]
+    assert len(feature_ids) == len(set(feature_ids))
+
+
+def test_natural_earth_codes_map_to_iso3():
+    features = [
+        {'id': 'SDS', 'properties': {'name': 'S. Sudan'}},
+        {'id': '-99', 'properties': {'name': 'Kosovo'}},
+        {'id': 'SOM', 'properties': {'name': 'Somalia'}},
+        {'id': 'SOL', 'properties': {'name': 'Somaliland'}},
+    ]
+    assert [feature['id'] for feature in assign_dimension_ids(features)] == ['SSD', 'XKX', 'SOM', 'SOL']
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+from investment_tracker import MAX_FRAMES, window_frames, windowed_investment_figure
+
+# Twenty-five years of monthly cube rows, longer than MAX_FRAMES at monthly or quarterly spacing
+MONTHS = pd.date_range('2000-01-01', '2024-12-01', freq='MS')
+
+
+def test_long_monthly_window_is_coarsened_not_thinned():
+    rows, labels, spacing = window_frames(MONTHS, '2000-01-01', '2024-12-31', 'monthly')
+    assert spacing == 'yearly'
+    assert len(rows) <= MAX_FRAMES
+    assert labels == [str(year) for year in range(2000, 2025)]
+    # Each frame closes its year, so no period is skipped
+    assert (MONTHS[rows].month == 12).all()
+
+
+def test_coarsens_only_as_far_as_needed():
+    rows, labels, spacing = window_frames(MONTHS, '2015-01-01', '2024-12-31', 'monthly')
+    assert spacing == 'quarterly'
+    assert len(labels) == 40
+    assert labels[:2] == ['2015-Q1', '2015-Q2']
+
+
+def test_short_monthly_window_stays_monthly():
+    rows, labels, spacing = window_frames(MONTHS, '2020-01-01', '2022-12-31', 'monthly')
+    assert spacing == 'monthly'
+    assert len(rows) == 36
+    assert labels[0] == '2020-01' and labels[-1] == '2022-12'
+
+
+def test_years_are_strided_when_even_yearly_is_too_many():
+    rows, labels, spacing = window_frames(MONTHS, '2000-01-01', '2024-12-31', 'monthly', max_frames=10)
+    assert spacing == '3-yearly'
+    assert labels[-1] == '2024'
+    assert np.diff([int(label) for label in labels]).tolist() == [3] * (len(labels) - 1)
+
+
+def test_coarsened_spacing_is_named_in_the_title():
+    cube = np.zeros((len(MONTHS), 1, 1))
+    figure = windowed_investment_figure(MONTHS, np.array(['Asia']), np.array(['Energy']), cube, '2000-01-01',
+                                        '2024-12-31', 'monthly')
+    assert 'Yearly frames' in figure['layout']['title']['text']
+    assert len(figure['frames']) <= MAX_FRAMES
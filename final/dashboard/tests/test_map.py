@@ -0,0 +1,58 @@
+import importlib.util
+import json
+import sys
+import types
+
+import plotly.io as pio
+import pytest
+from plotly.utils import PlotlyJSONEncoder
+
+# key/key.py holds the Mapbox token and is kept out of the repository; the figures build without a real one
+if importlib.util.find_spec('key') is None or importlib.util.find_spec('key.key') is None:
+    sys.modules['key'] = types.ModuleType('key')
+    sys.modules['key.key'] = types.SimpleNamespace(mapbox_access_token='')
+
+# Pan event as plotly reports it, over East Asia
+RELAYOUT = {
+    'mapbox.center': {'lon': 120, 'lat': 30},
+    'mapbox.zoom': 4,
+    'mapbox._derived': {'coordinates': [[100, 45], [140, 45], [140, 15], [100, 15]]},
+}
+
+
+def apply_patch(figure, patch):
+    # What the browser does with a Patch response; these callbacks only ever assign
+    operations = json.loads(json.dumps(patch.to_plotly_json(), cls=PlotlyJSONEncoder))['operations']
+    for operation in operations:
+        assert operation['operation'] == 'Assign'
+        *parents, last = operation['location']
+        target = figure
+        for part in parents:
+            target = target[part]
+        target[last] = operation['params']['value']
+    return operations
+
+
+@pytest.fixture
+def dashboard():
+    import dashboard
+    return dashboard
+
+
+def test_layer_survives_viewport_stream(dashboard):
+    figure = json.loads(pio.to_json(dashboard.map_figure()))
+    apply_patch(figure, dashboard.update_map_layer('construction'))
+    construction, title = dashboard.combined_map().layer_update('construction')
+    assert figure['data'][0]['locations'] == construction['locations']
+    assert figure['layout']['title']['text'] == title
+
+    operations = apply_patch(figure, dashboard.stream_base_points(RELAYOUT))
+    bases_trace = ('data', dashboard.CombinedMap.bases_trace)
+    assert {tuple(operation['location'][:2]) for operation in operations} == {bases_trace}
+    assert figure['data'][0]['locations'] == construction['locations']
+    assert figure['data'][0]['z'] == construction['z']
+    assert figure['data'][0]['name'] == 'Construction'
+
+
+def test_both_callbacks_write_the_map(dashboard):
+    assert sum(output.startswith('map-graph.figure') for output in dashboard.app.callback_map) == 2
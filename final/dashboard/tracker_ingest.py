@@ -0,0 +1,114 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from ingest import COLUMNAR_DIR, append_table, read_tracker_sheet, table_path, write_atomic
+
+# Flat files kept from the China Global Investment Tracker, and the workbook sheet each one is cut from
+TRACKER_DATASETS = {
+    'Investments.csv': 0,
+    'Construction.csv': 1,
+    'Investments_and_construction.csv': 3,
+}
+
+KEYS_SUFFIX = '.keys.npz'
+
+
+def canonical_rows(df):
+    # Every cell as text that reads the same from the workbook and from the CSV: numbers in one float format (so 1,
+    # 1.0 and '1' agree), everything else stripped, missing values empty
+    canonical = {}
+    for column in df.columns:
+        values = df[column]
+        numbers = pd.to_numeric(values, errors='coerce')
+        text = values.astype(object).where(values.notna(), '').astype(str).str.strip()
+        canonical[column] = text.where(numbers.isna(), numbers.map('{:.15g}'.format))
+    return pd.DataFrame(canonical, index=df.index)
+
+
+def row_keys(df):
+    # 64-bit content hash per row, salted with how often the same row has been seen before, so genuinely repeated
+    # deals are kept as often as they occur
+    hashes = pd.util.hash_pandas_object(canonical_rows(df), index=False)
+    occurrence = hashes.groupby(hashes.to_numpy()).cumcount()
+    return pd.util.hash_pandas_object(pd.DataFrame({'row': hashes, 'occurrence': occurrence}), index=False).to_numpy()
+
+
+def _keys_path(csv_path):
+    name = os.path.splitext(os.path.basename(csv_path))[0] + KEYS_SUFFIX
+    return os.path.join(os.path.dirname(csv_path) or '.', COLUMNAR_DIR, name)
+
+
+def stored_keys(csv_path):
+    # Row keys of the CSV as it is on disk; kept beside the columnar tables and only recomputed if the file was changed
+    # by something other than an incremental update
+    stat = os.stat(csv_path)
+    keys_path = _keys_path(csv_path)
+    try:
+        with np.load(keys_path) as stored:
+            if tuple(stored['signature']) == (stat.st_mtime_ns, stat.st_size):
+                return stored['keys']
+    except (OSError, KeyError, ValueError):
+        pass
+    keys = np.sort(row_keys(pd.read_csv(csv_path)))
+    _save_keys(csv_path, keys)
+    return keys
+
+
+def _save_keys(csv_path, keys):
+    stat = os.stat(csv_path)
+    keys_path = _keys_path(csv_path)
+    os.makedirs(os.path.dirname(keys_path), exist_ok=True)
+
+    def write(temp_path):
+        with open(temp_path, 'wb') as f:
+            np.savez(f, keys=keys, signature=np.array([stat.st_mtime_ns, stat.st_size]))
+    write_atomic(keys_path, write)
+
+
+def new_rows(csv_path, release):
+    # Rows of a tracker release that the CSV doesn't hold yet
+    columns = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    if list(release.columns) != columns:
+        raise ValueError(f"Tracker sheet columns {list(release.columns)} don't match {csv_path} columns {columns}")
+    keys = row_keys(release)
+    fresh = ~np.isin(keys, stored_keys(csv_path))
+    return release[fresh], keys[fresh]
+
+
+def append_rows(csv_path, rows, keys):
+    # Appends the rows to the CSV and to its columnar copy, and records their keys; nothing already stored is re-read
+    table_path(csv_path)
+    base_stat = os.stat(csv_path)
+    previous_keys = stored_keys(csv_path)
+    csv_rows = rows.to_csv(header=False, index=False)
+    with open(csv_path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+        f.write(csv_rows.encode())
+    append_table(csv_path, csv_rows, base_stat)
+    _save_keys(csv_path, np.sort(np.concatenate([previous_keys, keys])))
+
+
+def update_from_tracker(workbook_path, data_dir='data'):
+    # Merges a new tracker release into the flat files; returns the number of new rows per file
+    added = {}
+    for name, sheet in TRACKER_DATASETS.items():
+        csv_path = os.path.join(data_dir, name)
+        release = read_tracker_sheet(workbook_path, sheet)
+        rows, keys = new_rows(csv_path, release)
+        if len(rows):
+            append_rows(csv_path, rows, keys)
+        added[name] = len(rows)
+    return added
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("usage: python tracker_ingest.py <tracker workbook> [data directory]")
+    for name, count in update_from_tracker(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else 'data').items():
+        print(f"{name}: {count} new rows")